@@ -0,0 +1,827 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ft_bench
+Offline benchmark for ft_bot. Starts a local stub of the freqtrade REST API
+for each simulated bot, drives ft_bot.on_message with synthetic messages
+through fake discord channels, and reports latency percentiles, throughput
+and peak memory.
+
+Nothing here talks to discord or to a real freqtrade bot.
+
+Example:
+    python3 ft_bench.py --servers 15 --users 10 --requests 20 --latency 0.05 --trades 5000
+
+"""
+
+import aiohttp
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import random
+import resource
+import secrets
+import sys
+import time
+import tempfile
+import tracemalloc
+
+import discord
+import numpy as np
+
+from aiohttp import web
+from datetime import date, datetime, timedelta, timezone
+from tabulate import tabulate
+from typing import Dict, List, Optional
+
+import ft_bot
+
+logger = logging.getLogger("ft_bench")
+
+DEFAULT_COMMANDS = "ping,status,profit,trades,daily,weekly,monthly,show_config"
+LADDER_FILLS = [1, 10, 100, 1000]
+STUB_USERNAME = "bench"
+STUB_PASSWORD = "bench"
+ACCESS_TOKEN_LIFETIME = 900
+REFRESH_TOKEN_LIFETIME = 86400
+STUB_WS_TOKEN = "bench-ws-token"
+STUB_TOTAL_STAKE = 10000.0
+STUB_FIAT_RATE = 1.08
+
+
+def make_order(trade_id: int, nr: int, price: float) -> dict:
+    return {
+        'pair': f"COIN{trade_id % 50}/USDT",
+        'order_id': f"{trade_id}-{nr}",
+        'status': 'closed',
+        'remaining': 0.0,
+        'amount': 10.0,
+        'filled': 10.0,
+        'safe_price': price,
+        'cost': price * 10.0,
+        'ft_is_entry': True,
+        'ft_order_side': 'buy',
+        'is_open': False,
+        'order_type': 'limit',
+        'order_filled_timestamp': 1677628800000 + nr * 60000,
+        'order_filled_date': "2023-03-01 00:00:00",
+    }
+
+def make_trade(trade_id: int, is_open: bool, num_orders: int = 1, close_ts: Optional[int] = None) -> dict:
+    """
+    Make a trade shaped like freqtrade's Trade.to_json()
+    """
+    if close_ts is None:
+        close_ts = 1677628800000 + trade_id * 600000
+    close_date = datetime.fromtimestamp(close_ts / 1000, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    profit_ratio = random.uniform(-0.05, 0.05)
+    return {
+        'trade_id': trade_id,
+        'pair': f"COIN{trade_id % 50}/USDT",
+        'base_currency': f"COIN{trade_id % 50}",
+        'quote_currency': 'USDT',
+        'is_open': is_open,
+        'is_short': False,
+        'exchange': 'binance',
+        'amount': 10.0,
+        'stake_amount': 100.0,
+        'max_stake_amount': 100.0 * num_orders,
+        'strategy': 'BenchStrategy',
+        'enter_tag': 'bench',
+        'timeframe': 5,
+        'open_date': "2023-03-01 00:00:00",
+        'open_timestamp': close_ts - 3600000,
+        'open_rate': 10.0,
+        'close_date': None if is_open else close_date,
+        'close_timestamp': None if is_open else close_ts,
+        'close_rate': None if is_open else 10.0 * (1 + profit_ratio),
+        'close_profit': None if is_open else profit_ratio,
+        'close_profit_pct': None if is_open else round(profit_ratio * 100, 2),
+        'close_profit_abs': None if is_open else profit_ratio * 100,
+        'profit_ratio': profit_ratio,
+        'profit_pct': round(profit_ratio * 100, 2),
+        'profit_abs': profit_ratio * 100,
+        'realized_profit': 0.0,
+        'realized_profit_ratio': None,
+        'total_profit_abs': profit_ratio * 100,
+        'total_profit_ratio': profit_ratio,
+        'exit_reason': None if is_open else 'roi',
+        'current_rate': 10.0 * (1 + profit_ratio),
+        'leverage': 1.0,
+        'stop_loss_abs': 9.0,
+        'stop_loss_ratio': -0.1,
+        'initial_stop_loss_abs': 9.0,
+        'initial_stop_loss_ratio': -0.1,
+        'stoploss_current_dist': -1.0,
+        'stoploss_current_dist_ratio': -0.1,
+        'open_orders': None,
+        'exit_order_status': None,
+        'orders': [make_order(trade_id, nr, 10.0 - nr * 0.1) for nr in range(num_orders)],
+    }
+
+def make_jwt(kind: str, lifetime: float) -> str:
+    """
+    Make a JWT shaped token with an 'exp' claim. The stub keeps track of what
+    it issued, so the signature is just random.
+    """
+    def segment(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+    claims = {'identity': {'u': STUB_USERNAME}, 'type': kind, 'exp': time.time() + lifetime}
+    return f"{segment({'alg': 'HS256', 'typ': 'JWT'})}.{segment(claims)}.{secrets.token_hex(16)}"
+
+def shift_period(start: date, unit: str, step: int) -> date:
+    if unit == 'months':
+        months = start.year * 12 + start.month - 1 + step
+        return start.replace(year=months // 12, month=months % 12 + 1)
+    return start + timedelta(**{unit: step})
+
+def timeunit_profit(closed: List[dict], unit: str, timescale: int) -> dict:
+    """
+    Profit per day, week or month the way freqtrade's RPC._rpc_timeunit_profit
+    works it out, walking back a period at a time from the current total stake
+    """
+    start = datetime.now(timezone.utc).date()
+    if unit == 'weeks':
+        start -= timedelta(days=start.weekday())
+    if unit == 'months':
+        start = start.replace(day=1)
+
+    stake = STUB_TOTAL_STAKE
+    data = []
+    for step in range(timescale):
+        begin = shift_period(start, unit, -step)
+        since = datetime.combine(begin, datetime.min.time(), timezone.utc).timestamp() * 1000
+        until = datetime.combine(shift_period(begin, unit, 1), datetime.min.time(), timezone.utc).timestamp() * 1000
+        profits = [t['close_profit_abs'] for t in closed if since <= t['close_timestamp'] < until]
+        amount = sum(profits)
+        stake -= amount
+        data.append({
+            'date': begin.isoformat(),
+            'abs_profit': amount,
+            'starting_balance': stake,
+            'rel_profit': round(amount / stake, 8) if stake > 0 else 0,
+            'fiat_value': amount * STUB_FIAT_RATE,
+            'trade_count': len(profits),
+        })
+    return {'stake_currency': 'USDT', 'fiat_display_currency': 'USD', 'data': data}
+
+
+class StubFreqtrade:
+    """
+    Local stand-in for one freqtrade REST API. Like freqtrade, it accepts
+    BasicAuth or JWT access tokens and answers 401 to anything else.
+    """
+    def __init__(self, latency: float, num_trades: int, num_open: int, num_orders: int,
+                 jwt: bool = True, access_lifetime: float = ACCESS_TOKEN_LIFETIME):
+        self.latency = latency
+        # answer API requests with an HTML page and this status, like a failing reverse proxy
+        self.error_status: Optional[int] = None
+        self.jwt = jwt
+        self.access_lifetime = access_lifetime
+        self.tokens: Dict[str, tuple] = {} # token -> (kind, expiry)
+        self.requests = 0
+        self.inflight = 0
+        self.max_inflight = 0
+        self.logins = 0
+        self.refreshes = 0
+        self.rejected = 0
+        self.closed = [make_trade(i, False) for i in range(1, num_trades + 1)]
+        self.open = [make_trade(num_trades + i, True, num_orders) for i in range(1, num_open + 1)]
+        self.config = {
+            'dry_run': True, 'exchange': 'binance', 'trading_mode': 'spot',
+            'stake_amount': 100, 'stake_currency': 'USDT', 'fiat_display_currency': 'USD',
+            'max_open_trades': num_open, 'minimal_roi': {'0': 0.05},
+            'entry_pricing': {}, 'exit_pricing': {}, 'trailing_stop': False, 'stoploss': -0.1,
+            'position_adjustment_enable': num_orders > 1, 'max_entry_position_adjustment': -1,
+            'timeframe': '5m', 'strategy': 'BenchStrategy', 'state': 'running',
+        }
+        # events sent over each message websocket connection, the connection
+        # is dropped after its events unless it is the last one
+        self.ws_script: List[List[dict]] = [[]]
+        self.ws_connections = 0
+        self.ws_subscribed: List[str] = []
+        self.ws_sent = 0
+        self.runner = None
+        self.port = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/api/v1/token/login', self.login)
+        app.router.add_post('/api/v1/token/refresh', self.refresh)
+        app.router.add_get('/api/v1/message/ws', self.message_ws)
+        app.router.add_get('/api/v1/{endpoint:.*}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def _issue(self, kind: str, lifetime: float) -> str:
+        token = make_jwt(kind, lifetime)
+        self.tokens[token] = (kind, time.time() + lifetime)
+        return token
+
+    def expire_tokens(self):
+        """
+        Expire every access token handed out so far, as if they had timed out
+        """
+        for token, (kind, expiry) in self.tokens.items():
+            if kind == 'access':
+                self.tokens[token] = (kind, time.time())
+
+    def _basic_auth_ok(self, header: str) -> bool:
+        try:
+            auth = aiohttp.BasicAuth.decode(header)
+        except ValueError:
+            return False
+        return auth.login == STUB_USERNAME and auth.password == STUB_PASSWORD
+
+    def _token_ok(self, token: str, kind: str) -> bool:
+        issued = self.tokens.get(token)
+        return issued is not None and issued[0] == kind and issued[1] > time.time()
+
+    def _authorized(self, request) -> bool:
+        header = request.headers.get('Authorization', "")
+        if header.startswith("Bearer "):
+            return self._token_ok(header[len("Bearer "):], 'access')
+        return header.startswith("Basic ") and self._basic_auth_ok(header)
+
+    async def login(self, request):
+        if not self.jwt:
+            return web.json_response({'detail': 'Not Found'}, status=404)
+        if not self._basic_auth_ok(request.headers.get('Authorization', "")):
+            self.rejected += 1
+            return web.json_response({'detail': 'Unauthorized'}, status=401)
+        self.logins += 1
+        return web.json_response({'access_token': self._issue('access', self.access_lifetime),
+                                  'refresh_token': self._issue('refresh', REFRESH_TOKEN_LIFETIME)})
+
+    async def refresh(self, request):
+        if not self.jwt:
+            return web.json_response({'detail': 'Not Found'}, status=404)
+        header = request.headers.get('Authorization', "")
+        if not (header.startswith("Bearer ") and self._token_ok(header[len("Bearer "):], 'refresh')):
+            self.rejected += 1
+            return web.json_response({'detail': 'Unauthorized'}, status=401)
+        self.refreshes += 1
+        return web.json_response({'access_token': self._issue('access', self.access_lifetime)})
+
+    async def message_ws(self, request):
+        token = request.query.get('token', "")
+        if token != STUB_WS_TOKEN and not self._token_ok(token, 'access'):
+            self.rejected += 1
+            return web.json_response({'detail': 'Unauthorized'}, status=401)
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        connection = self.ws_connections
+        self.ws_connections += 1
+        msg = await ws.receive_json()
+        if msg.get('type') == 'subscribe':
+            self.ws_subscribed = msg['data']
+
+        for event in self.ws_script[min(connection, len(self.ws_script) - 1)]:
+            if event['type'] in self.ws_subscribed:
+                await ws.send_json(event)
+                self.ws_sent += 1
+        if connection < len(self.ws_script) - 1:
+            # drop the connection, like a restarting bot would
+            await ws.close()
+            return ws
+
+        async for msg in ws:
+            pass
+        return ws
+
+    async def handle(self, request):
+        self.requests += 1
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.inflight -= 1
+        if not self._authorized(request):
+            self.rejected += 1
+            return web.json_response({'detail': 'Unauthorized'}, status=401)
+        if self.error_status is not None:
+            return web.Response(text="<html><body><h1>Bad Gateway</h1></body></html>",
+                                status=self.error_status, content_type='text/html')
+        endpoint = request.match_info['endpoint']
+        query = request.query
+
+        if endpoint == 'ping':
+            return web.json_response({'status': 'pong'})
+        if endpoint == 'show_config':
+            return web.json_response(self.config)
+        if endpoint == 'status':
+            return web.json_response(self.open)
+        if endpoint.startswith('trade/'):
+            trade_id = int(endpoint.split("/")[1])
+            trade = next((t for t in self.open if t['trade_id'] == trade_id), None)
+            if trade is None:
+                return web.json_response({'detail': 'Trade not found'}, status=404)
+            return web.json_response(trade)
+        if endpoint == 'trades':
+            limit = min(int(query.get('limit', 500)), 500)
+            offset = int(query.get('offset', 0))
+            trades = self.closed[offset:offset + limit]
+            return web.json_response({'trades': trades, 'trades_count': len(trades),
+                                      'offset': offset, 'total_trades': len(self.closed)})
+        if endpoint in ('daily', 'weekly', 'monthly'):
+            unit = ft_bot.TIMEUNITS[endpoint].callback
+            return web.json_response(timeunit_profit(self.closed, unit, int(query.get('timescale', 7))))
+        if endpoint == 'balance':
+            return web.json_response({'currencies': [], 'total': STUB_TOTAL_STAKE,
+                                      'value': STUB_TOTAL_STAKE * STUB_FIAT_RATE,
+                                      'symbol': 'USD', 'stake': 'USDT'})
+        if endpoint == 'profit':
+            return web.json_response({
+                'profit_closed_coin': 10.0, 'profit_closed_percent_mean': 1.0,
+                'profit_closed_ratio_mean': 0.01, 'profit_closed_percent': 1.0,
+                'profit_closed_ratio': 0.01, 'profit_closed_fiat': 10.0,
+                'profit_all_coin': 12.0, 'profit_all_ratio_mean': 0.012, 'profit_all_percent': 1.2,
+                'profit_all_ratio': 0.012, 'profit_all_fiat': 12.0,
+                'trade_count': len(self.closed) + len(self.open),
+                'closed_trade_count': len(self.closed),
+                'first_trade_date': "2023-03-01 00:00:00", 'first_trade_humanized': "a year ago",
+                'latest_trade_date': "2023-03-02 00:00:00", 'latest_trade_humanized': "a day ago",
+                'avg_duration': "1:00:00", 'best_pair': "COIN1/USDT", 'best_pair_profit_ratio': 0.05,
+                'winning_trades': len(self.closed) // 2, 'losing_trades': len(self.closed) // 2,
+                'profit_factor': 1.2, 'winrate': 0.5, 'expectancy': 0.1, 'expectancy_ratio': 0.1,
+                'max_drawdown': 0.05, 'max_drawdown_abs': 50.0,
+                'max_drawdown_start': "2023-03-01 00:00:00", 'max_drawdown_end': "2023-03-02 00:00:00",
+                'trading_volume': 10000.0, 'bot_start_timestamp': 0, 'bot_start_date': "2023-03-01 00:00:00",
+            })
+        return web.json_response({'detail': 'Not Found'}, status=404)
+
+
+class FakeAuthor:
+    bot = False
+
+    def __init__(self, author_id: int):
+        self.id = author_id
+
+
+class FakeChannel:
+    """
+    Stand-in for a discord text channel, counting what is sent to it
+    """
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.messages = 0
+        self.embeds = 0
+        self.chars = 0
+
+    async def send(self, content=None, embeds=None, view=None, **kwargs):
+        self.messages += 1
+        self.embeds += len(embeds or [])
+        self.chars += len(content or "") + sum(len(e) for e in embeds or [])
+
+
+class FailingChannel(FakeChannel):
+    """
+    Fake channel whose first send fails, like a discord hiccup
+    """
+    async def send(self, content=None, embeds=None, view=None, **kwargs):
+        if not self.messages:
+            self.messages += 1
+            raise discord.DiscordServerError(FakeResponse(), "first send fails")
+        await super().send(content, embeds, view, **kwargs)
+
+
+class FakeResponse:
+    status = 503
+    reason = "Service Unavailable"
+
+
+class FakeMessage:
+    def __init__(self, content: str, channel: FakeChannel):
+        self.content = content
+        self.channel = channel
+        self.author = FakeAuthor(channel.id)
+
+
+def make_commands(commands: List[str], servers: List[str], open_ids: List[int], fanout: bool) -> List[str]:
+    messages = []
+    for cmd in commands:
+        targets = servers + ([ft_bot.FANOUT_TARGET] if fanout else [])
+        for server in targets:
+            if cmd == 'trades':
+                messages.append(f"/trades {server} 50")
+            elif cmd == 'status' and open_ids and server != ft_bot.FANOUT_TARGET:
+                messages.append(f"/status {server}")
+                messages.append(f"/status {server} {open_ids[0]}")
+            else:
+                messages.append(f"/{cmd} {server}")
+    return messages
+
+async def run_benchmark(args) -> dict:
+    stubs = [StubFreqtrade(args.latency, args.trades, args.open_trades, args.orders)
+             for _ in range(args.servers)]
+    for stub in stubs:
+        await stub.start()
+
+    servers = [{'name': f"bot{i}", 'ip': '127.0.0.1', 'port': stub.port,
+                'username': STUB_USERNAME, 'password': STUB_PASSWORD, 'use_jwt': not args.basic_auth}
+               for i, stub in enumerate(stubs)]
+    bot = ft_bot.ft_bot(intents=discord.Intents.default(),
+                        servers=servers,
+                        cache=None if args.cache else {'ttl': {k: 0 for k in ft_bot.DEFAULT_CACHE_TTLS}},
+                        poller={'interval': 5} if args.poller else None,
+                        trade_store=args.trade_store,
+                        warm_cache=args.warm_cache,
+                        admission={'max_running': args.max_running, 'per_server': args.per_server},
+                        workers={'size': args.workers, 'pool': args.pool, 'fast_json': args.fast_json})
+    if not args.pacing:
+        bot.sender.rate = 10 ** 9
+    await bot.setup_hook()
+    await bot.on_ready()
+
+    names = [s['name'] for s in servers]
+    open_ids = [t['trade_id'] for t in stubs[0].open]
+    pool = make_commands(args.commands.split(","), names, open_ids, args.fanout)
+    channels = [FakeChannel(1000 + u) for u in range(args.users)]
+    latencies: Dict[str, List[float]] = {}
+
+    async def user(channel: FakeChannel):
+        rng = random.Random(channel.id)
+        for _ in range(args.requests):
+            content = rng.choice(pool)
+            started = time.perf_counter()
+            await bot.on_message(FakeMessage(content, channel))
+            elapsed = time.perf_counter() - started
+            cmd = content.split(" ")[0].lstrip(ft_bot.CMD_PREFIX_CHAR)
+            if ft_bot.FANOUT_TARGET in content.split(" "):
+                cmd += f" {ft_bot.FANOUT_TARGET}"
+            latencies.setdefault(cmd, []).append(elapsed)
+
+    if args.warmup:
+        await asyncio.gather(*[bot.on_message(FakeMessage(c, FakeChannel(0))) for c in pool])
+
+    # tracing allocations slows the bot down a lot, so only when asked for
+    if args.tracemalloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[user(c) for c in channels])
+    duration = time.perf_counter() - started
+    peak = None
+    if args.tracemalloc:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    await bot.close()
+    for stub in stubs:
+        await stub.stop()
+
+    return {
+        'latencies': latencies,
+        'duration': duration,
+        'peak_traced': peak,
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'upstream_requests': sum(s.requests for s in stubs),
+        'messages': sum(c.messages for c in channels),
+        'cache': bot.cache.stats(),
+        'admission': bot.admission.stats(),
+        'loop_lag': bot.metrics.quantile('loop_lag', "-", "-", 0.99),
+    }
+
+async def run_ladder_benchmark(args) -> List[list]:
+    """
+    Time rendering /status <trade_id> for trades with a growing number of fills
+    """
+    bot = ft_bot.ft_bot(intents=discord.Intents.default(),
+                        servers=[{'name': 'bot0', 'ip': '127.0.0.1', 'port': 8080,
+                                  'username': 'bench', 'password': 'bench'}])
+    bot.servers['bot0']['config'] = {'position_adjustment_enable': True}
+    rows = []
+    for fills in LADDER_FILLS:
+        trade = make_trade(1, True, fills)
+        timings = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            bot._process_status('bot0', trade, trade['trade_id'])
+            timings.append(time.perf_counter() - started)
+        p50, p95, p99 = np.percentile(timings, [50, 95, 99]) * 1000
+        rows.append([fills, len(timings), f"{p50:.2f}", f"{p95:.2f}", f"{p99:.2f}"])
+    await bot.close()
+    return rows
+
+def check_bot(stubs: List[StubFreqtrade], **kwargs) -> ft_bot.ft_bot:
+    """
+    Make a bot for the stubs that fetches everything upstream
+    """
+    servers = [{'name': f"bot{i}", 'ip': '127.0.0.1', 'port': stub.port,
+                'username': STUB_USERNAME, 'password': STUB_PASSWORD}
+               for i, stub in enumerate(stubs)]
+    return ft_bot.ft_bot(intents=discord.Intents.default(), servers=servers,
+                         cache={'ttl': {k: 0 for k in ft_bot.DEFAULT_CACHE_TTLS}}, **kwargs)
+
+async def check_auth(args) -> List[tuple]:
+    """
+    Log in, refresh a token close to expiry, log in again after a 401,
+    and fall back to BasicAuth for servers without token endpoints
+    """
+    stub = StubFreqtrade(0, 10, 1, 1, access_lifetime=ft_bot.TOKEN_REFRESH_MARGIN + 1)
+    legacy = StubFreqtrade(0, 10, 1, 1, jwt=False)
+    await stub.start()
+    await legacy.start()
+    bot = check_bot([stub, legacy])
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{stub.port}/api/v1/ping") as r:
+                results.append(("missing credentials get 401", r.status == 401, f"status {r.status}"))
+
+        await bot._api_get('bot0', 'ping')
+        results.append(("login", stub.logins == 1 and stub.rejected == 1,
+                        f"{stub.logins} logins, {stub.rejected} rejected"))
+
+        # the access token is now inside the refresh margin
+        await asyncio.sleep(1.1)
+        stub.access_lifetime = ACCESS_TOKEN_LIFETIME
+        await bot._api_get('bot0', 'ping')
+        results.append(("refresh before expiry", stub.refreshes == 1 and stub.logins == 1,
+                        f"{stub.refreshes} refreshes, {stub.logins} logins"))
+
+        stub.expire_tokens()
+        await bot._api_get('bot0', 'ping')
+        results.append(("login again after 401", stub.logins == 2 and stub.rejected == 2,
+                        f"{stub.logins} logins, {stub.rejected} rejected"))
+
+        await bot._api_get('bot1', 'ping')
+        retry_at = bot.servers['bot1'].get('token_retry_at', 0)
+        results.append(("BasicAuth fallback", legacy.rejected == 0 and retry_at > time.time(),
+                        f"{legacy.rejected} rejected, token retry in {retry_at - time.time():.0f}s"))
+    finally:
+        await bot.close()
+        await stub.stop()
+        await legacy.stop()
+    return results
+
+def same_summary(local: dict, upstream: dict) -> Optional[str]:
+    """
+    Compare two /daily style summaries
+    :return: The first difference, or None if they match
+    """
+    if len(local['data']) != len(upstream['data']):
+        return f"{len(local['data'])} periods, freqtrade has {len(upstream['data'])}"
+    for ours, theirs in zip(local['data'], upstream['data']):
+        for key in ('date', 'trade_count'):
+            if ours[key] != theirs[key]:
+                return f"{theirs['date']} {key}: {ours[key]} != {theirs[key]}"
+        for key in ('abs_profit', 'starting_balance', 'rel_profit', 'fiat_value'):
+            if not np.isclose(ours[key], theirs[key], rtol=1e-6, atol=1e-8):
+                return f"{theirs['date']} {key}: {ours[key]} != {theirs[key]}"
+    return None
+
+async def check_timeunits(args) -> List[tuple]:
+    """
+    Compare the daily, weekly and monthly summaries worked out from the
+    trade store with what the stub works out the way freqtrade does
+    """
+    stub = StubFreqtrade(0, 0, 1, 1)
+    now = int(time.time() * 1000)
+    # a trade every 4 hours over the last 80 days, the newest closed a minute ago
+    stub.closed = [make_trade(i, False, close_ts=now - (480 - i) * 4 * 3600000 - 60000)
+                   for i in range(1, 481)]
+    await stub.start()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = check_bot([stub], trade_store=f"{tmp}/trades.sqlite")
+        try:
+            for cmd, timescale in (('daily', 30), ('weekly', 12), ('monthly', 4)):
+                params = {'timescale': timescale}
+                upstream = await bot._api_get('bot0', cmd, params)
+                local = await bot.process_command('bot0', cmd, params)
+                difference = same_summary(local, upstream)
+                results.append((f"{cmd} {timescale} matches freqtrade", difference is None,
+                                difference or f"{sum(d['trade_count'] for d in local['data'])} trades"))
+        finally:
+            await bot.close()
+            await stub.stop()
+    return results
+
+def make_fill(msg_type: str, trade: dict) -> dict:
+    """
+    Make a message websocket event shaped like freqtrade's RPC fill messages
+    """
+    data = {'trade_id': trade['trade_id'], 'pair': trade['pair'], 'direction': 'Long',
+            'amount': trade['amount'], 'stake_currency': trade['quote_currency'],
+            'sub_trade': False, 'enter_tag': trade['enter_tag']}
+    if msg_type == 'entry_fill':
+        data['open_rate'] = trade['open_rate']
+    else:
+        data.update(close_rate=trade['close_rate'], exit_reason=trade['exit_reason'],
+                    profit_ratio=trade['profit_ratio'], profit_amount=trade['profit_abs'])
+    return {'type': msg_type, 'data': data}
+
+async def check_events(args) -> List[tuple]:
+    """
+    Subscribe to the stub's message websocket, get dropped after the first
+    fill, reconnect and get the rest, and post every fill to the events channel
+    """
+    stub = StubFreqtrade(0, 2, 0, 1)
+    stub.ws_script = [
+        [make_fill('entry_fill', stub.closed[0])],
+        [make_fill('exit_fill', stub.closed[0]), make_fill('entry_fill', stub.closed[1]),
+         {'type': 'analyzed_df', 'data': {}}],
+    ]
+    await stub.start()
+    channel = FakeChannel(1)
+    bot = check_bot([stub], events={'channel': channel.id})
+    bot.get_channel = lambda channel_id: channel if channel_id == channel.id else None
+    bot.sender.rate = 10 ** 9
+    results = []
+    try:
+        bot.events.start(list(bot.servers))
+        deadline = time.monotonic() + ft_bot.EVENT_BACKOFF_MIN + 5
+        while channel.embeds < 3 and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        results.append(("subscribed", stub.ws_subscribed == bot.events.event_types,
+                        f"{len(stub.ws_subscribed)} event types"))
+        results.append(("reconnected after a drop", stub.ws_connections == 2 and bot.events.connected.get('bot0'),
+                        f"{stub.ws_connections} connections"))
+        results.append(("fills posted", stub.ws_sent == 3 and channel.embeds == 3,
+                        f"{stub.ws_sent} sent, {channel.embeds} posted"))
+    finally:
+        await bot.close()
+        await stub.stop()
+    return results
+
+async def check_health(args) -> List[tuple]:
+    """
+    Mark a server down when a proxy in front of it answers with 5xx errors or
+    HTML pages, but not when the bot itself answers 404
+    """
+    stub = StubFreqtrade(0, 10, 1, 1)
+    await stub.start()
+    bot = check_bot([stub])
+    health = bot.servers['bot0']['health']
+    results = []
+
+    async def attempts(endpoint: str, count: int):
+        for _ in range(count):
+            try:
+                await bot._api_get('bot0', endpoint)
+            except Exception:
+                pass
+
+    try:
+        await attempts('trade/999999', ft_bot.HEALTH_FAILURE_THRESHOLD)
+        results.append(("404 keeps the server up", health.state == ft_bot.ServerHealth.HEALTHY,
+                        health.status()))
+
+        stub.error_status = 502
+        await attempts('ping', ft_bot.HEALTH_FAILURE_THRESHOLD)
+        results.append(("502 marks the server down", health.state == ft_bot.ServerHealth.DOWN,
+                        health.status()))
+
+        stub.error_status = None
+        health.retry_at = 0
+        await attempts('ping', 1)
+        results.append(("probe brings it back", health.state == ft_bot.ServerHealth.HEALTHY,
+                        health.status()))
+
+        stub.error_status = 200
+        await attempts('ping', ft_bot.HEALTH_FAILURE_THRESHOLD)
+        results.append(("HTML pages mark the server down", health.state == ft_bot.ServerHealth.DOWN,
+                        health.status()))
+    finally:
+        await bot.close()
+        await stub.stop()
+    return results
+
+async def check_admission(args) -> List[tuple]:
+    """
+    Send fan-outs and single server commands at once with a per server limit
+    of one, and check no stub ever serves two of them at a time
+    """
+    stubs = [StubFreqtrade(0.2, 10, 1, 1) for _ in range(2)]
+    for stub in stubs:
+        await stub.start()
+    bot = check_bot(stubs, admission={'per_server': 1})
+    bot.sender.rate = 10 ** 9
+    results = []
+    try:
+        await bot._prefetch_configs(list(bot.servers))
+        for stub in stubs:
+            stub.max_inflight = 0
+        channel = FakeChannel(1)
+        await asyncio.gather(*[bot.on_message(FakeMessage(content, channel))
+                               for content in ("/profit all", "/status bot0", "/daily all", "/ping bot1")])
+        results.append(("per server limit holds for fan-outs", all(s.max_inflight == 1 for s in stubs),
+                        f"at most {max(s.max_inflight for s in stubs)} requests at once"))
+
+        # the "queued" reply fails, the command still ends with an error reply and frees its slot
+        failing = FailingChannel(2)
+        await asyncio.gather(bot.on_message(FakeMessage("/profit bot0", channel)),
+                             bot.on_message(FakeMessage("/ping bot0", failing)))
+        results.append(("failed queued reply answered", failing.chars > 0 and bot.admission.total == 0,
+                        f"{failing.messages} sends, {bot.admission.stats()}"))
+    finally:
+        await bot.close()
+        for stub in stubs:
+            await stub.stop()
+    return results
+
+CHECKS = {
+    'admission': check_admission,
+    'auth': check_auth,
+    'events': check_events,
+    'health': check_health,
+    'timeunits': check_timeunits,
+}
+
+async def run_checks(args) -> List[tuple]:
+    names = list(CHECKS) if 'all' in args.check else args.check
+    rows = []
+    for name in names:
+        try:
+            results = await CHECKS[name](args)
+        except Exception as e:
+            results = [("ran", False, repr(e))]
+        rows.extend([name, check, "ok" if ok else "FAILED", detail] for check, ok, detail in results)
+    return rows
+
+def report(args, result: dict):
+    rows = []
+    everything = []
+    for cmd, values in sorted(result['latencies'].items()):
+        everything.extend(values)
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+        rows.append([cmd, len(values), f"{p50:.1f}", f"{p95:.1f}", f"{p99:.1f}"])
+    p50, p95, p99 = np.percentile(everything, [50, 95, 99]) * 1000
+    rows.append(["ALL", len(everything), f"{p50:.1f}", f"{p95:.1f}", f"{p99:.1f}"])
+
+    print(f"{args.servers} servers x {args.users} users x {args.requests} requests, "
+          f"{args.latency * 1000:.0f}ms upstream latency, {args.trades} closed trades per server")
+    print(tabulate(rows, headers=["COMMAND", "COUNT", "P50 ms", "P95 ms", "P99 ms"], tablefmt='outline'))
+    print(f"Throughput:        {len(everything) / result['duration']:.1f} commands/s")
+    print(f"Peak RSS:          {result['max_rss'] / 1024:.1f} MiB")
+    if result['loop_lag'] is not None:
+        print(f"Loop lag P99:      {result['loop_lag'] * 1000:.1f} ms")
+    if result['peak_traced'] is not None:
+        print(f"Peak traced:       {result['peak_traced'] / 1024 / 1024:.1f} MiB allocated while measuring")
+    print(f"Upstream requests: {result['upstream_requests']}")
+    print(f"Discord messages:  {result['messages']}")
+    print(f"Response cache:    {result['cache']}")
+    print(f"Admission:         {result['admission']}")
+
+def add_arguments():
+    parser = argparse.ArgumentParser(description="Offline benchmark for ft_bot")
+    parser.add_argument("--servers", type=int, default=3, help="Number of stub freqtrade servers.")
+    parser.add_argument("--users", type=int, default=5, help="Number of concurrent users.")
+    parser.add_argument("--requests", type=int, default=20, help="Commands sent by each user.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub API latency in seconds.")
+    parser.add_argument("--trades", type=int, default=1000, help="Closed trades per server.")
+    parser.add_argument("--open-trades", type=int, default=5, help="Open trades per server.")
+    parser.add_argument("--orders", type=int, default=3, help="Filled orders per open trade.")
+    parser.add_argument("--commands", default=DEFAULT_COMMANDS, help="Comma separated commands to send.")
+    parser.add_argument("--fanout", action='store_true', help="Also send commands to 'all' servers.")
+    parser.add_argument("--basic-auth", action='store_true', help="Skip the JWT token flow.")
+    parser.add_argument("--no-cache", dest='cache', action='store_false', help="Disable the response cache.")
+    parser.add_argument("--poller", action='store_true', help="Enable the background poller.")
+    parser.add_argument("--trade-store", default=None, help="SQLite file to use as trade store.")
+    parser.add_argument("--workers", type=int, default=2, help="Decode and render pool size, 0 for none.")
+    parser.add_argument("--pool", choices=['thread', 'process'], default='thread', help="Decode pool type.")
+    parser.add_argument("--std-json", dest='fast_json', action='store_false', help="Use the standard json decoder.")
+    parser.add_argument("--warm-cache", default=None, help="SQLite file to use as warm cache.")
+    parser.add_argument("--max-running", type=int, default=ft_bot.DEFAULT_ADMISSION['max_running'],
+                        help="Commands allowed to run at once.")
+    parser.add_argument("--per-server", type=int, default=ft_bot.DEFAULT_ADMISSION['per_server'],
+                        help="Commands allowed to run at once per server.")
+    parser.add_argument("--pacing", action='store_true', help="Keep discord channel rate pacing.")
+    parser.add_argument("--tracemalloc", action='store_true', help="Trace peak allocations (slow).")
+    parser.add_argument("--warmup", action='store_true', help="Send every command once before measuring.")
+    parser.add_argument("--order-ladder", action='store_true',
+                        help=f"Only time /status <trade_id> rendering for {LADDER_FILLS} fills.")
+    parser.add_argument("--check", action='append', choices=list(CHECKS) + ['all'],
+                        help="Only run a functional check against the stubs, can be repeated.")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+def main():
+    args = add_arguments()
+    random.seed(args.seed)
+    logging.getLogger("ft_bot").setLevel(logging.WARNING)
+    logging.getLogger("discord").setLevel(logging.ERROR)
+    if args.check:
+        rows = asyncio.run(run_checks(args))
+        print(tabulate(rows, headers=["CHECK", "STEP", "RESULT", "DETAIL"], tablefmt='outline'))
+        sys.exit(0 if all(row[2] == "ok" for row in rows) else 1)
+    if args.order_ladder:
+        rows = asyncio.run(run_ladder_benchmark(args))
+        print(tabulate(rows, headers=["FILLS", "COUNT", "P50 ms", "P95 ms", "P99 ms"], tablefmt='outline'))
+        return
+    report(args, asyncio.run(run_benchmark(args)))
+
+if __name__ == "__main__":
+    main()
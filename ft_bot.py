@@ -22,20 +22,43 @@ Conception Date: 2023-03-17
 
 import aiohttp
 import argparse
+import asyncio
 import arrow
+import base64
+import bisect
+import codecs
+import hashlib
 import discord
+import functools
 import json
 import logging
+import numpy as np
+import os
+import re
+import sqlite3
+import time
 import traceback
+import zlib
 
+from aiohttp import web
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
+from datetime import datetime, timezone
 from discord.embeds import Embed
 from discord.ui import Button
-from discord import Color
+from discord import Color, app_commands
 
 from tabulate import tabulate
 from typing import Any, Dict, List, Optional
-from urllib.parse import urlencode, urlparse, urlunparse
+from urllib.parse import quote, unquote, urlencode, urlparse, urlunparse
+
+try:
+    import rapidjson
+except ImportError:
+    rapidjson = None
 
 logging.basicConfig(
     level=logging.INFO,
@@ -51,34 +74,1579 @@ class TimeunitMappings:
     callback: str
     default: int
 
+TIMEUNITS = {
+    'hourly': TimeunitMappings('Hourly', 'hours', 'hours', 'hours', 24),
+    'daily': TimeunitMappings('Daily', 'days', 'days', 'days', 12),
+    'weekly': TimeunitMappings('Weekly', 'weeks', 'weeks (starting from Monday)', 'weeks', 12),
+    'monthly': TimeunitMappings('Monthly', 'months', 'months', 'months', 12),
+    'quarterly': TimeunitMappings('Quarterly', 'quarters', 'quarters', 'quarters', 4),
+}
+# summaries freqtrade has no endpoint for, only available with a trade store
+LOCAL_TIMEUNITS = ['hourly', 'quarterly']
+
 CMD_PREFIX_CHAR = "/"
 
+# JWT handling: refresh tokens this many seconds before they expire, and
+# retry a failed login after TOKEN_RETRY_INTERVAL, using BasicAuth meanwhile
+TOKEN_REFRESH_MARGIN = 60
+TOKEN_RETRY_INTERVAL = 300
+DEFAULT_TOKEN_LIFETIME = 300
+
+# Reserved server name that fans a command out to every configured server
+FANOUT_TARGET = "all"
+DEFAULT_SERVER_TIMEOUT = 10
+
+# Response cache defaults, seconds to keep each endpoint's response for
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_CACHE_TTLS = {
+    'show_config': 300,
+    'ping': 2,
+    'status': 2,
+    'trade': 2,
+    'profit': 10,
+    'trades': 10,
+    'trade_store_sync': 10,
+    'daily': 60,
+    'weekly': 60,
+    'monthly': 60,
+    'balance': 60,
+}
+
+# Background poller defaults, intervals in seconds
+DEFAULT_POLL_ENDPOINTS = ['status', 'profit', 'daily', 'show_config']
+DEFAULT_POLL_INTERVAL = 30
+DEFAULT_POLL_MAX_INTERVAL = 300
+POLL_LATENCY_FACTOR = 10 # poll no more often than 10x a server's round trip time
+POLL_IDLE_AFTER = 600 # back off polling servers nobody has asked about for this long
+
+# freqtrade message websocket events to subscribe to, reconnect backoff in seconds
+DEFAULT_EVENT_TYPES = ['entry_fill', 'exit_fill', 'entry_cancel', 'exit_cancel',
+                       'status', 'warning', 'exception', 'startup',
+                       'protection_trigger', 'protection_trigger_global']
+EVENT_BACKOFF_MIN = 1
+EVENT_BACKOFF_MAX = 300
+
+# Trade history sync, freqtrade serves at most 500 trades per /trades call
+DEFAULT_NUM_TRADES = 10
+TRADES_PAGE_SIZE = 500
+TRADE_SYNC_OVERLAP = 100 # re-read this many trades to catch trades that closed out of id order
+TRADE_SYNC_KEY = 'trade_store_sync' # response cache endpoint name rate limiting trade store syncs
+
+# Server configs are refreshed in the background once this old, or when a server's strategy or restart time changes.
+# Failed fetches are retried after a backoff instead of on every command.
+CONFIG_REFRESH_INTERVAL = 3600
+CONFIG_RETRY_MIN = 10
+CONFIG_RETRY_MAX = 600
+
+# The last response of every command is saved to the warm cache in batches this often
+WARM_CACHE_FLUSH_INTERVAL = 5
+# /trades responses for display are decoded as they arrive, keeping only what _process_trades shows
+TRADE_FIELDS = ('trade_id', 'pair', 'close_date', 'close_profit_pct', 'profit_abs', 'quote_currency')
+STREAM_CHUNK_SIZE = 65536
+
+# Large tables are shown a page at a time, rendered pages are kept briefly
+PAGE_SIZE = 20
+PAGE_CACHE_TTL = 30
+RENDER_REGISTRY_SIZE = 256
+
+# Buttons carry the command they act on in their custom_id, which discord limits in length
+CUSTOM_ID_LIMIT = 100
+
+# Number of pairs listed by /portfolio
+PORTFOLIO_TOP_PAIRS = 10
+
+# Discord message and embed limits
+MESSAGE_LIMIT = 2000
+EMBEDS_PER_MESSAGE = 10
+EMBED_DESCRIPTION_LIMIT = 4096
+EMBED_FIELD_LIMIT = 1024
+EMBED_TOTAL_LIMIT = 6000
+EMBED_MAX_FIELDS = 25
+
+# Outbound pacing, Discord allows around 5 messages per 5 seconds per channel
+CHANNEL_RATE_LIMIT = 5
+CHANNEL_RATE_PERIOD = 5.0
+SEND_QUEUE_IDLE = 60
+
+# Server health. Requests time out after the smoothed latency plus 4x its deviation (like TCP),
+# and servers failing this many times in a row are skipped until a /ping probe gets through
+HEALTH_FAILURE_THRESHOLD = 3
+HEALTH_MIN_TIMEOUT = 2.0
+HEALTH_LATENCY_FACTOR = 4
+HEALTH_RETRY_MIN = 15
+HEALTH_RETRY_MAX = 300
+
+# How many commands run at once, overall and per server, and how many one user can have waiting in a channel
+DEFAULT_ADMISSION = {
+    'max_running': 16,
+    'per_server': 4,
+    'max_queued': 3,
+}
+# Waiting commands start in this order, anything not listed is heavy
+COMMAND_PRIORITIES = {'ping': 0, 'status': 0, 'show_config': 1, 'profit': 1, 'daily': 1}
+HEAVY_PRIORITY = 2
+
+# Snapshots the alert rules are evaluated on
+ALERT_SOURCES = {'trades': 'status', 'profit': 'profit'}
+ALERT_ENDPOINTS = {endpoint: source for source, endpoint in ALERT_SOURCES.items()}
+
+# (user id, channel id) of the command being handled, to share the upstream fairly between them
+REQUESTER: ContextVar[Optional[tuple]] = ContextVar('requester', default=None)
+
+# Decoding and rendering happen in a worker pool so large payloads don't stall the event loop.
+# Responses smaller than min_bytes are decoded in place, where a pool would only add overhead.
+DEFAULT_WORKERS = {
+    'pool': 'thread',
+    'size': 2,
+    'min_bytes': 65536,
+    'fast_json': True,
+    'lag_warning': 0.25,
+}
+LOOP_LAG_INTERVAL = 0.5
+
+# How often to check the YAML config file for changes, in seconds
+CONFIG_POLL_INTERVAL = 5
+# Top level settings that are only read at startup
+RESTART_SETTINGS = ['cache', 'poller', 'trade_store', 'warm_cache', 'events', 'metrics', 'slash_commands',
+                    'workers', 'admission', 'alerts']
+
+# Live dashboards from /watch, intervals in seconds
+WATCH_DEFAULT_INTERVAL = 60
+WATCH_MIN_INTERVAL = 10
+WATCH_MAX = 50
+WATCH_SLACK = 1 # update watches due this soon along with the ones due now
+
+# Latency histogram buckets in seconds, and where to serve Prometheus metrics by default
+METRIC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_STAGES = ['queue', 'parse', 'fetch', 'render', 'send']
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_METRICS_PORT = 9108
+
+# Connection pool defaults, overridable per entry in the YAML `servers` list
+DEFAULT_SERVER_LIMITS = {
+    'max_connections': 4,
+    'keepalive_timeout': 60,
+    'dns_cache_ttl': 300,
+}
+
+
+class RefreshButton(discord.ui.DynamicItem[Button],
+                    template=r"ft:r:(?P<server>[^:]+):(?P<cmd>\w+):(?P<args>[^:]*)"):
+    """
+    Refresh button whose custom_id carries the command it refreshes, so it
+    needs no state of its own and keeps working after a restart
+    """
+    def __init__(self, server: str, cmd: str, cmd_args: list):
+        super().__init__(Button(label="Refresh",
+                                custom_id=f"ft:r:{quote(server, safe='')}:{cmd}:{encode_args(cmd_args)}"))
+        self.server = server
+        self.cmd = cmd
+        self.cmd_args = cmd_args
 
-class RefreshableView(discord.ui.View):
-    def __init__(self,
-                 cmdfunc,
-                 cmd_args,
-                 callback,
-                 server: str,
-                 cmd: str,
-                 params: dict = {}):
-        super().__init__()
-        self.cmdfunc = cmdfunc
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(unquote(match['server']), match['cmd'], decode_args(match['args']))
+
+    async def callback(self, interaction):
+        await interaction.client.refresh_message(interaction, self.server, self.cmd, self.cmd_args)
+
+
+class PageButton(discord.ui.DynamicItem[Button],
+                 template=r"ft:p:(?P<server>[^:]+):(?P<cmd>\w+):(?P<dir>[pn]):(?P<page>\d+):(?P<args>[^:]*)"):
+    """
+    Prev or Next button, its custom_id carries the command and the page it goes to
+    """
+    def __init__(self, server: str, cmd: str, cmd_args: list, direction: str, page: int, disabled: bool = False):
+        super().__init__(Button(label="Prev" if direction == 'p' else "Next",
+                                disabled=disabled,
+                                custom_id=(f"ft:p:{quote(server, safe='')}:{cmd}:{direction}:{page}:"
+                                           f"{encode_args(cmd_args)}")))
+        self.server = server
+        self.cmd = cmd
         self.cmd_args = cmd_args
-        self.callback = callback
+        self.page = page
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(unquote(match['server']), match['cmd'], decode_args(match['args']),
+                   match['dir'], int(match['page']))
+
+    async def callback(self, interaction):
+        await interaction.client.show_page(interaction, self.server, self.cmd, self.cmd_args, self.page)
+
+
+class JumpButton(discord.ui.DynamicItem[Button],
+                 template=r"ft:j:(?P<server>[^:]+):(?P<cmd>\w+):(?P<pages>\d+):(?P<args>[^:]*)"):
+    def __init__(self, server: str, cmd: str, cmd_args: list, total_pages: int):
+        super().__init__(Button(label="Jump",
+                                custom_id=(f"ft:j:{quote(server, safe='')}:{cmd}:{total_pages}:"
+                                           f"{encode_args(cmd_args)}")))
         self.server = server
         self.cmd = cmd
-        self.params = params
+        self.cmd_args = cmd_args
+        self.total_pages = total_pages
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(unquote(match['server']), match['cmd'], decode_args(match['args']), int(match['pages']))
+
+    async def callback(self, interaction):
+        await interaction.response.send_modal(JumpToPageModal(self))
+
+
+class JumpToPageModal(discord.ui.Modal, title="Jump to page"):
+    page = discord.ui.TextInput(label="Page", max_length=6)
+
+    def __init__(self, jump: JumpButton):
+        super().__init__()
+        self.jump = jump
+        self.page.placeholder = f"1 - {jump.total_pages}"
+
+    async def on_submit(self, interaction):
+        try:
+            page = int(self.page.value) - 1
+        except ValueError:
+            await interaction.response.send_message(f"'{self.page.value}' is not a page number.",
+                                                    ephemeral=True)
+            return
+        if not 0 <= page < self.jump.total_pages:
+            await interaction.response.send_message(f"Pick a page from 1 to {self.jump.total_pages}.",
+                                                    ephemeral=True)
+            return
+        await interaction.client.show_page(interaction, self.jump.server, self.jump.cmd,
+                                           self.jump.cmd_args, page)
+
+
+def refresh_view(server: str, cmd: str, cmd_args: list) -> Optional[discord.ui.View]:
+    """
+    Make the view for a refreshable result, or None if the command does not fit in a custom_id
+    """
+    view = discord.ui.View(timeout=None)
+    view.add_item(RefreshButton(server, cmd, cmd_args))
+    return view if fits_custom_ids(view) else None
+
+def page_view(server: str, cmd: str, cmd_args: list, page: int, total_pages: int) -> Optional[discord.ui.View]:
+    """
+    Make the navigation view for one page of a paginated result
+    """
+    view = discord.ui.View(timeout=None)
+    view.add_item(PageButton(server, cmd, cmd_args, 'p', max(page - 1, 0), disabled=page <= 0))
+    view.add_item(PageButton(server, cmd, cmd_args, 'n', min(page + 1, total_pages - 1),
+                             disabled=page >= total_pages - 1))
+    view.add_item(JumpButton(server, cmd, cmd_args, total_pages))
+    return view if fits_custom_ids(view) else None
+
+
+class RenderRegistry:
+    """
+    Bounded LRU of recently rendered pages and results, shared by every message
+    showing them, so memory stays flat however many messages have buttons
+    """
+    def __init__(self, max_entries: int = RENDER_REGISTRY_SIZE, ttl: float = PAGE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key: tuple) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: tuple, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SendQueue:
+    """
+    Outbound message queue per channel. Queued output is packed into as few
+    messages as Discord allows, and sends are paced to stay inside the channel
+    rate limit.
+    """
+    def __init__(self,
+                 rate: int = CHANNEL_RATE_LIMIT,
+                 period: float = CHANNEL_RATE_PERIOD):
+        self.rate = rate
+        self.period = period
+
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._sent: Dict[int, deque] = {}
+
+    async def send(self,
+                   channel,
+                   content: Optional[str] = None,
+                   embed: Optional[Embed] = None,
+                   embeds: Optional[List[Embed]] = None,
+                   view: Optional[discord.ui.View] = None):
+        """
+        Queue output for a channel and wait until it has been sent
+        :return: The (last) message the output was sent in
+        """
+        embeds = list(embeds or []) + ([embed] if embed is not None else [])
+        future = asyncio.get_running_loop().create_future()
+
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = self._queues[channel.id] = asyncio.Queue()
+            self._workers[channel.id] = asyncio.create_task(self._run(channel))
+        queue.put_nowait((content, embeds, view, future))
+
+        return await future
+
+    def stop(self):
+        for task in self._workers.values():
+            task.cancel()
+        self._workers.clear()
+        self._queues.clear()
+
+    async def _run(self, channel):
+        queue = self._queues[channel.id]
+        while True:
+            try:
+                items = [await asyncio.wait_for(queue.get(), SEND_QUEUE_IDLE)]
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    del self._queues[channel.id]
+                    del self._workers[channel.id]
+                    return
+                continue
+
+            while not queue.empty():
+                items.append(queue.get_nowait())
+
+            for content, embeds, view, futures in self._pack(items):
+                try:
+                    message = await self._send(channel, content, embeds, view)
+                except Exception as e:
+                    logger.warning(f"Sending to channel {channel.id} failed: {e}")
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for future in futures:
+                    if not future.done():
+                        future.set_result(message)
+
+    def _pack(self, items: list) -> list:
+        """
+        Pack queued output into [content, embeds, view, futures] messages
+        """
+        messages = []
+        for content, embeds, view, future in items:
+            # a view belongs to one result, so don't share its message
+            start_new = view is not None
+            packed = False
+            for chunk in (split_message(content, MESSAGE_LIMIT) if content else []):
+                messages.append([chunk, [], None, []])
+                start_new = False
+                packed = True
+
+            for embed in [part for e in embeds for part in split_embed(e)]:
+                last = messages[-1] if messages else None
+                if (start_new or last is None or last[2] is not None
+                        or len(last[1]) >= EMBEDS_PER_MESSAGE
+                        or sum(len(e) for e in last[1]) + len(embed) > EMBED_TOTAL_LIMIT):
+                    last = [None, [], None, []]
+                    messages.append(last)
+                    start_new = False
+                last[1].append(embed)
+                packed = True
+
+            if not packed:
+                future.set_result(None)
+                continue
+            if view is not None:
+                messages[-1][2] = view
+            messages[-1][3].append(future)
+        return messages
+
+    async def _send(self, channel, content, embeds, view):
+        sent = self._sent.setdefault(channel.id, deque(maxlen=self.rate))
+        if len(sent) == self.rate:
+            wait = sent[0] + self.period - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        kwargs = {'embeds': embeds}
+        if view is not None:
+            kwargs['view'] = view
+        try:
+            message = await channel.send(content, **kwargs)
+        except discord.HTTPException as e:
+            if e.status != 429:
+                raise
+            # rate limited anyway, wait for as long as Discord asks and retry once
+            headers = e.response.headers if e.response is not None else {}
+            retry_after = float(headers.get('Retry-After') or headers.get('X-RateLimit-Reset-After') or 1)
+            logger.info(f"Rate limited in channel {channel.id}, retrying in {retry_after}s")
+            await asyncio.sleep(retry_after)
+            message = await channel.send(content, **kwargs)
+
+        sent.append(time.monotonic())
+        return message
+
+
+class InteractionChannel:
+    """
+    Reply target for a deferred slash command, so its output can go through
+    the same SendQueue as replies to text commands
+    """
+    def __init__(self, interaction: discord.Interaction):
+        self.interaction = interaction
+        self.id = interaction.id
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        kwargs = {k: v for k, v in kwargs.items() if v is not None}
+        if content is not None:
+            kwargs['content'] = content
+        return await self.interaction.followup.send(wait=True, **kwargs)
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of API responses with a TTL per endpoint.
+    Concurrent requests for the same key share a single upstream call.
+    """
+    def __init__(self,
+                 max_entries: int = DEFAULT_CACHE_SIZE,
+                 ttls: Optional[Dict[str, float]] = None):
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_CACHE_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+
+        self._entries: OrderedDict = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        # (server, endpoint) -> [hits, misses, coalesced]
+        self.counts: Dict[tuple, List[int]] = {}
+
+    @staticmethod
+    def make_key(server: str, endpoint: str, params: dict = {}) -> tuple:
+        return (server, endpoint, tuple(sorted((k, str(v)) for k, v in params.items())))
+
+    def ttl_for(self, endpoint: str) -> float:
+        return self.ttls.get(endpoint.split("/")[0], 0)
+
+    async def get(self, key: tuple, fetch) -> Any:
+        """
+        Get a cached response, or await fetch() to get it
+        :param key: Cache key from make_key()
+        :param fetch: Coroutine function doing the upstream call
+        """
+        counts = self.counts.setdefault((key[0], key[1].split("/")[0]), [0, 0, 0])
+        entry = self._entries.get(key)
+        if entry is not None:
+            expiry, value = entry
+            if expiry > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                counts[0] += 1
+                return value
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            counts[1] += 1
+            task = asyncio.ensure_future(self._fetch(key, fetch))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+            counts[2] += 1
+
+        # shielded so one caller giving up does not cancel the shared call
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: tuple, fetch) -> Any:
+        try:
+            value = await fetch()
+        finally:
+            self._inflight.pop(key, None)
+
+        ttl = self.ttl_for(key[1])
+        if ttl > 0:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, server: str, endpoint: Optional[str] = None):
+        # 'trade' also matches the trade/<id> endpoints
+        for key in [k for k in self._entries
+                    if k[0] == server and (endpoint is None or k[1].split("/")[0] == endpoint)]:
+            del self._entries[key]
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.coalesced + self.misses
+        return (self.hits + self.coalesced) / total if total else 0.0
+
+    def stats(self) -> str:
+        return (f"{len(self._entries)}/{self.max_entries} entries, "
+                f"{self.hits} hits, {self.coalesced} coalesced, {self.misses} misses "
+                f"({self.hit_ratio():.0%} hit ratio)")
+
+
+class Metrics:
+    """
+    Latency histograms, error counts and payload sizes per stage, server and command
+    """
+    def __init__(self, buckets: tuple = METRIC_BUCKETS):
+        self.buckets = buckets
+        # (stage, server, cmd) -> [count per bucket..., count above the last bucket]
+        self.histograms: Dict[tuple, List[int]] = {}
+        self.sums: Dict[tuple, float] = {}
+        self.errors: Dict[tuple, int] = {}
+        # (server, endpoint) -> bytes received
+        self.payload_bytes: Dict[tuple, int] = {}
+
+    def observe(self, stage: str, server: str, cmd: str, seconds: float):
+        key = (stage, server, cmd)
+        counts = self.histograms.get(key)
+        if counts is None:
+            counts = self.histograms[key] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sums[key] = self.sums.get(key, 0.0) + seconds
+
+    def error(self, stage: str, server: str, cmd: str):
+        key = (stage, server, cmd)
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def payload(self, server: str, endpoint: str, nbytes: int):
+        key = (server, endpoint)
+        self.payload_bytes[key] = self.payload_bytes.get(key, 0) + nbytes
+
+    @contextmanager
+    def timed(self, stage: str, server: str, cmd: str):
+        """
+        Time a block as one stage of a command, counting it as an error if it raises
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.error(stage, server, cmd)
+            raise
+        finally:
+            self.observe(stage, server, cmd, time.perf_counter() - started)
+
+    def quantile(self, stage: str, server: str, cmd: str, q: float) -> Optional[float]:
+        counts = self.histograms.get((stage, server, cmd))
+        if counts is None:
+            return None
+        return histogram_quantile(self.buckets, counts, q)
+
+    def prometheus(self, cache: Optional[ResponseCache] = None) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+        """
+        lines = ["# HELP ft_bot_stage_seconds Time spent in each stage of a command.",
+                 "# TYPE ft_bot_stage_seconds histogram"]
+        for (stage, server, cmd), counts in sorted(self.histograms.items()):
+            labels = prometheus_labels(stage=stage, server=server, command=cmd)
+            cumulative = 0
+            for le, n in zip([str(b) for b in self.buckets] + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f'ft_bot_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"ft_bot_stage_seconds_sum{{{labels}}} {self.sums[(stage, server, cmd)]}")
+            lines.append(f"ft_bot_stage_seconds_count{{{labels}}} {cumulative}")
+
+        lines += ["# HELP ft_bot_errors_total Commands that failed, by the stage they failed in.",
+                  "# TYPE ft_bot_errors_total counter"]
+        for (stage, server, cmd), n in sorted(self.errors.items()):
+            lines.append(f"ft_bot_errors_total{{{prometheus_labels(stage=stage, server=server, command=cmd)}}} {n}")
+
+        lines += ["# HELP ft_bot_payload_bytes_total Response bytes received from freqtrade.",
+                  "# TYPE ft_bot_payload_bytes_total counter"]
+        for (server, endpoint), n in sorted(self.payload_bytes.items()):
+            lines.append(f"ft_bot_payload_bytes_total{{{prometheus_labels(server=server, command=endpoint)}}} {n}")
+
+        if cache is not None:
+            lines += ["# HELP ft_bot_cache_requests_total Response cache lookups by result.",
+                      "# TYPE ft_bot_cache_requests_total counter"]
+            for (server, endpoint), counts in sorted(cache.counts.items()):
+                for result, n in zip(['hit', 'miss', 'coalesced'], counts):
+                    labels = prometheus_labels(server=server, command=endpoint, result=result)
+                    lines.append(f"ft_bot_cache_requests_total{{{labels}}} {n}")
+            lines += ["# HELP ft_bot_cache_hit_ratio Share of lookups answered without a new upstream call.",
+                      "# TYPE ft_bot_cache_hit_ratio gauge",
+                      f"ft_bot_cache_hit_ratio {cache.hit_ratio()}"]
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self, cache: Optional[ResponseCache] = None) -> str:
+        """
+        Summarise the metrics as tables for the /metrics command
+        """
+        def ms(value):
+            return f"{value * 1000:.1f}" if value is not None else "-"
+
+        commands = sorted({(server, cmd) for stage, server, cmd in self.histograms if stage in METRIC_STAGES}
+                          | {(server, cmd) for stage, server, cmd in self.errors if stage in METRIC_STAGES})
+        rows = [["SERVER", "CMD", "COUNT", "FETCH P50/P95", "RENDER P95", "SEND P95", "ERRORS"]]
+        for server, cmd in commands:
+            rows.append([server, cmd,
+                         sum(self.histograms.get(('fetch', server, cmd))
+                             or self.histograms.get(('parse', server, cmd), [])),
+                         f"{ms(self.quantile('fetch', server, cmd, 0.5))}/{ms(self.quantile('fetch', server, cmd, 0.95))}",
+                         ms(self.quantile('render', server, cmd, 0.95)),
+                         ms(self.quantile('send', server, cmd, 0.95)),
+                         sum(self.errors.get((stage, server, cmd), 0) for stage in METRIC_STAGES)])
+
+        upstream = sorted({(server, cmd) for stage, server, cmd in self.histograms if stage == 'upstream'})
+        cache_counts = cache.counts if cache is not None else {}
+        urows = [["SERVER", "ENDPOINT", "CALLS", "P50/P95", "KB", "CACHE HITS"]]
+        for server, endpoint in upstream:
+            hits, misses, coalesced = cache_counts.get((server, endpoint), [0, 0, 0])
+            lookups = hits + misses + coalesced
+            urows.append([server, endpoint,
+                          sum(self.histograms[('upstream', server, endpoint)]),
+                          f"{ms(self.quantile('upstream', server, endpoint, 0.5))}/{ms(self.quantile('upstream', server, endpoint, 0.95))}",
+                          f"{self.payload_bytes.get((server, endpoint), 0) / 1024:.0f}",
+                          f"{(hits + coalesced) / lookups:.0%}" if lookups else "-"])
+
+        msg = f"**Command latency (ms):**\n```\n{tabulate(rows, headers='firstrow', tablefmt='simple')}```\n"
+        msg += f"**Upstream calls (ms):**\n```\n{tabulate(urows, headers='firstrow', tablefmt='simple')}```"
+        if cache is not None:
+            msg += f"\n*Response cache:* `{cache.stats()}`"
+        if ('loop_lag', "-", "-") in self.histograms:
+            msg += f"\n*Event loop lag P50/P99 (ms):* `{ms(self.quantile('loop_lag', '-', '-', 0.5))}/{ms(self.quantile('loop_lag', '-', '-', 0.99))}`"
+        return msg
+
+
+class ApiStatusError(Exception):
+    """
+    A freqtrade API request answered with a status other than 200
+    """
+    def __init__(self, status: int):
+        super().__init__(f"Error: Status {status} received.")
+        self.status = status
+
+
+class ServerHealth:
+    """
+    Latency and failure tracking for one server, with a circuit breaker.
+    Healthy servers get a timeout adapted to their latency. After too many
+    failures in a row the server is marked down and requests fail fast until
+    a /ping probe succeeds.
+    """
+    HEALTHY = 'healthy'
+    DOWN = 'down'
+    PROBING = 'probing'
+
+    def __init__(self, max_timeout: float):
+        self.max_timeout = max_timeout
+        self.state = self.HEALTHY
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.failures = 0
+        self.backoff = 1
+        self.retry_interval = HEALTH_RETRY_MIN
+        self.retry_at = 0.0
+        self.last_error: Optional[str] = None
+        self.probe: Optional[asyncio.Task] = None
+
+    def timeout(self) -> float:
+        if self.srtt is None:
+            return self.max_timeout
+        timeout = max(HEALTH_MIN_TIMEOUT, self.srtt + HEALTH_LATENCY_FACTOR * self.rttvar)
+        # doubled for every timeout in a row, in case the server is just slow
+        return min(self.max_timeout, timeout * self.backoff)
+
+    def record_success(self, latency: float):
+        if self.srtt is None:
+            self.srtt = latency
+            self.rttvar = latency / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - latency)
+            self.srtt = 0.875 * self.srtt + 0.125 * latency
+        self.state = self.HEALTHY
+        self.failures = 0
+        self.backoff = 1
+        self.retry_interval = HEALTH_RETRY_MIN
+
+    def record_failure(self, error: Exception):
+        self.last_error = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+        self.failures += 1
+        if isinstance(error, asyncio.TimeoutError):
+            self.backoff = min(self.backoff * 2, 64)
+
+        if self.state == self.PROBING:
+            self.retry_interval = min(self.retry_interval * 2, HEALTH_RETRY_MAX)
+        elif self.failures < HEALTH_FAILURE_THRESHOLD:
+            return
+        self.state = self.DOWN
+        self.retry_at = time.monotonic() + self.retry_interval
+
+    def status(self) -> str:
+        if self.state == self.HEALTHY:
+            if self.srtt is None:
+                return "ok"
+            return f"ok {self.srtt * 1000:.0f}ms, timeout {self.timeout():.1f}s"
+        if self.state == self.PROBING:
+            return "probing"
+        retry = max(0, self.retry_at - time.monotonic())
+        return f"down, retry in {retry:.0f}s ({truncate_block(self.last_error or '', 60)})"
+
+
+class AdmissionScheduler:
+    """
+    Limits how many commands run at once, overall and per server. Commands that
+    have to wait start by priority, and round robin across requesters within a
+    priority, skipping commands for servers that are still busy. A command for
+    several servers, like a fan-out, takes one slot overall and one on each of
+    its servers.
+    """
+    def __init__(self,
+                 max_running: int = DEFAULT_ADMISSION['max_running'],
+                 per_server: int = DEFAULT_ADMISSION['per_server'],
+                 max_queued: int = DEFAULT_ADMISSION['max_queued']):
+        self.max_running = max_running
+        self.per_server = per_server
+        self.max_queued = max_queued
+
+        self.total = 0
+        self.running: Dict[str, int] = {}
+        # priority -> requester -> waiting (servers, future), requesters in round robin order
+        self._queues: Dict[int, OrderedDict] = {}
+        self._waiting: Dict[Any, int] = {}
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def _servers_free(self, servers: tuple) -> bool:
+        return all(self.running.get(server, 0) < self.per_server for server in servers)
+
+    def _has_room(self, servers: tuple) -> bool:
+        return self.total < self.max_running and self._servers_free(servers)
+
+    def _take(self, servers: tuple):
+        self.total += 1
+        for server in servers:
+            self.running[server] = self.running.get(server, 0) + 1
+        self.admitted += 1
+
+    def waiting(self) -> int:
+        return sum(self._waiting.values())
+
+    async def acquire(self, servers: tuple, requester, priority: int, on_queued=None) -> bool:
+        """
+        Wait for a slot to run a command in
+        :param servers: Servers the command calls, it waits until all of them have room
+        :param requester: Who the command is for, waiting commands are shared fairly between requesters
+        :param priority: Lower runs first
+        :param on_queued: Coroutine function called with the number of waiting commands if this one has to wait
+        :return: False if the requester already has too many commands waiting
+        """
+        if self._has_room(servers):
+            self._take(servers)
+            return True
+        if self._waiting.get(requester, 0) >= self.max_queued:
+            self.rejected += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (servers, future)
+        self._queues.setdefault(priority, OrderedDict()).setdefault(requester, deque()).append(waiter)
+        self._waiting[requester] = self._waiting.get(requester, 0) + 1
+        self.queued += 1
+        try:
+            if on_queued is not None:
+                await on_queued(self.waiting())
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just as the wait was given up
+                self.release(servers)
+            else:
+                self._remove(priority, requester, waiter)
+            raise
+        return True
+
+    def release(self, servers: tuple):
+        self.total -= 1
+        for server in servers:
+            self.running[server] -= 1
+            if not self.running[server]:
+                del self.running[server]
+        self._dispatch()
+
+    def _remove(self, priority: int, requester, waiter: tuple):
+        requesters = self._queues.get(priority, {})
+        waiters = requesters.get(requester)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del requesters[requester]
+        self._waiting[requester] -= 1
+        if not self._waiting[requester]:
+            del self._waiting[requester]
+
+    def _dispatch(self):
+        while self.total < self.max_running and self._start_next():
+            pass
+
+    def _start_next(self) -> bool:
+        for priority in sorted(self._queues):
+            requesters = self._queues[priority]
+            for requester, waiters in list(requesters.items()):
+                for waiter in waiters:
+                    servers, future = waiter
+                    if not self._servers_free(servers):
+                        continue
+                    self._remove(priority, requester, waiter)
+                    if requester in requesters:
+                        requesters.move_to_end(requester)
+                    self._take(servers)
+                    future.set_result(None)
+                    return True
+        return False
+
+    def stats(self) -> str:
+        return (f"{self.total} running, {self.waiting()} waiting, {self.admitted} admitted, "
+                f"{self.queued} queued, {self.rejected} rejected")
+
+
+class SnapshotPoller:
+    """
+    Polls a set of endpoints for each server in the background, keeping the
+    latest responses in memory so commands can be answered without a round trip
+    """
+    def __init__(self,
+                 fetch,
+                 endpoints: Optional[List[str]] = None,
+                 interval: float = DEFAULT_POLL_INTERVAL,
+                 max_interval: float = DEFAULT_POLL_MAX_INTERVAL,
+                 max_age: Optional[float] = None):
+        self.fetch = fetch
+        self.endpoints = endpoints or list(DEFAULT_POLL_ENDPOINTS)
+        self.interval = interval
+        self.max_interval = max_interval
+        self.max_age = max_age or 2 * interval
+
+        # server -> endpoint -> (timestamp, data)
+        self.snapshots: Dict[str, Dict[str, tuple]] = {}
+        # callables(server, endpoint, data) run on every new snapshot
+        self.listeners = []
+        self.intervals: Dict[str, float] = {}
+        # server -> endpoints not to poll, e.g. while pushed events keep them fresh
+        self.paused: Dict[str, set] = {}
+
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._last_used: Dict[str, float] = {}
+        self._wakeup: Dict[str, asyncio.Event] = {}
+
+    def start(self, servers: List[str]):
+        # stagger the servers across one interval so they are not polled all at once
+        for i, server in enumerate(servers):
+            if server not in self._tasks:
+                self._last_used[server] = time.monotonic()
+                self._wakeup[server] = asyncio.Event()
+                delay = i * self.interval / len(servers)
+                self._tasks[server] = asyncio.create_task(self._run(server, delay))
+
+    def stop(self, server: Optional[str] = None):
+        for s in ([server] if server is not None else list(self._tasks)):
+            task = self._tasks.pop(s, None)
+            if task is not None:
+                task.cancel()
+            self.snapshots.pop(s, None)
+            self.intervals.pop(s, None)
+
+    def touch(self, server: str):
+        """
+        Mark a server as in use, waking its poller up if it had backed off
+        """
+        idle = time.monotonic() - self._last_used.get(server, 0) > POLL_IDLE_AFTER
+        self._last_used[server] = time.monotonic()
+        if idle and server in self._wakeup:
+            self._wakeup[server].set()
+
+    def pause(self, server: str, endpoint: str):
+        self.paused.setdefault(server, set()).add(endpoint)
+
+    def resume(self, server: str, endpoint: str):
+        self.paused.get(server, set()).discard(endpoint)
+
+    async def refresh(self, server: str, endpoint: str):
+        """
+        Fetch a new snapshot of an endpoint right away
+        """
+        try:
+            self._store(server, endpoint, await self.fetch(server, endpoint))
+        except Exception as e:
+            logger.debug(f"{server}: refreshing '{endpoint}' failed: {e}")
+
+    def _store(self, server: str, endpoint: str, data):
+        self.snapshots.setdefault(server, {})[endpoint] = (time.time(), data)
+        for listener in self.listeners:
+            try:
+                listener(server, endpoint, data)
+            except Exception as e:
+                logger.warning(f"{server}: snapshot listener failed: {e}")
+
+    def get(self, server: str, endpoint: str) -> Optional[tuple]:
+        """
+        Get the latest snapshot of an endpoint, if it is recent enough
+        :return: (data, age in seconds) or None
+        """
+        snapshot = self.snapshots.get(server, {}).get(endpoint)
+        if snapshot is None:
+            return None
+        age = time.time() - snapshot[0]
+        if age > self.max_age:
+            return None
+        return snapshot[1], age
+
+    async def _run(self, server: str, delay: float):
+        await asyncio.sleep(delay)
+        interval = self.interval
+        while True:
+            started = time.monotonic()
+            errors = 0
+            for endpoint in self.endpoints:
+                if endpoint in self.paused.get(server, ()):
+                    continue
+                try:
+                    data = await self.fetch(server, endpoint)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    errors += 1
+                    logger.debug(f"{server}: polling '{endpoint}' failed: {e}")
+                    continue
+
+                self._store(server, endpoint, data)
+
+            latency = (time.monotonic() - started) / max(len(self.endpoints), 1)
+            idle = time.monotonic() - self._last_used[server] > POLL_IDLE_AFTER
+            if errors or idle:
+                interval = min(interval * 2, self.max_interval)
+            else:
+                interval = self.interval
+            self.intervals[server] = max(interval, latency * POLL_LATENCY_FACTOR)
+
+            wakeup = self._wakeup[server]
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), self.intervals[server])
+                interval = self.interval
+            except asyncio.TimeoutError:
+                pass
+
+
+@dataclass
+class AlertRule:
+    """
+    Alert when a field of an open trade (source 'trades') or of the profit
+    summary (source 'profit') goes above or below a level. A firing alert is
+    resolved once the value is back past the clear level, which defaults to
+    the trigger level.
+    """
+    name: str
+    field: str
+    source: str = 'trades'
+    above: Optional[float] = None
+    below: Optional[float] = None
+    clear: Optional[float] = None
+    servers: Optional[List[str]] = None
+
+    def triggered(self, value: float) -> bool:
+        return value > self.above if self.above is not None else value < self.below
+
+    def cleared(self, value: float) -> bool:
+        if self.above is not None:
+            return value <= (self.clear if self.clear is not None else self.above)
+        return value >= (self.clear if self.clear is not None else self.below)
+
+
+def make_alert_rule(rule: dict) -> AlertRule:
+    """
+    Check and convert one rule from the YAML `alerts` section
+    """
+    name = rule.get('name', rule.get('field'))
+    if not rule.get('field'):
+        raise Exception(f"Alert rule '{name}' has no field.")
+    if rule.get('source', 'trades') not in ALERT_SOURCES:
+        raise Exception(f"Alert rule '{name}' source must be one of {list(ALERT_SOURCES)}.")
+    if (rule.get('above') is None) == (rule.get('below') is None):
+        raise Exception(f"Alert rule '{name}' needs one of 'above' or 'below'.")
+    clear = rule.get('clear')
+    if clear is not None and (clear > rule['above'] if rule.get('above') is not None else clear < rule['below']):
+        raise Exception(f"Alert rule '{name}' clear level is on the wrong side of its trigger level.")
+    return AlertRule(name=name, field=rule['field'], source=rule.get('source', 'trades'),
+                     above=rule.get('above'), below=rule.get('below'), clear=clear,
+                     servers=rule.get('servers'))
+
+
+class AlertEngine:
+    """
+    Evaluates alert rules on the changes between consecutive snapshots.
+    Only values that changed since the last snapshot are checked, so the work
+    done follows the number of changes rather than trades times rules. An
+    alert fires once when its rule starts to match, and is resolved once.
+    """
+    def __init__(self, rules: List[AlertRule], notify):
+        self.rules = rules
+        # coroutine function(rule, server, trade or profit summary, value, firing)
+        self.notify = notify
+        # source -> field -> rules
+        self.by_field: Dict[str, Dict[str, List[AlertRule]]] = {}
+        for rule in rules:
+            self.by_field.setdefault(rule.source, {}).setdefault(rule.field, []).append(rule)
+
+        # (server, source) -> trade id, or None for the profit summary -> {field: value}
+        self._previous: Dict[tuple, Dict[Any, dict]] = {}
+        # (rule name, server, trade id or None) -> (time fired, value)
+        self.active: Dict[tuple, tuple] = {}
+        self.evaluations = 0
+        # notifications still being posted
+        self._pending: set = set()
+
+    def watches(self, source: str) -> bool:
+        return source in self.by_field
+
+    def on_snapshot(self, server: str, endpoint: str, data):
+        source = ALERT_ENDPOINTS.get(endpoint)
+        fields = self.by_field.get(source)
+        if not fields or data is None:
+            return
+        items = {t['trade_id']: t for t in data} if source == 'trades' else {None: data}
+        previous = self._previous.get((server, source), {})
+        current = {}
+        for key, item in items.items():
+            values = {field: item.get(field) for field in fields}
+            current[key] = values
+            old = previous.get(key, {})
+            for field, value in values.items():
+                if field in old and old[field] == value:
+                    continue
+                for rule in fields[field]:
+                    self._evaluate(rule, server, key, item, value)
+
+        # trades that closed can't alert any more
+        for key in previous.keys() - current.keys():
+            for rules in fields.values():
+                for rule in rules:
+                    self.active.pop((rule.name, server, key), None)
+        self._previous[(server, source)] = current
+
+    def _evaluate(self, rule: AlertRule, server: str, key, item: dict, value):
+        if rule.servers and server not in rule.servers:
+            return
+        if not isinstance(value, (int, float)):
+            return
+        self.evaluations += 1
+        alert = (rule.name, server, key)
+        if alert in self.active:
+            if rule.cleared(value):
+                del self.active[alert]
+                self._notify(alert, rule, server, item, value, False)
+        elif rule.triggered(value):
+            self.active[alert] = (time.time(), value)
+            self._notify(alert, rule, server, item, value, True)
+
+    def _notify(self, alert: tuple, rule: AlertRule, server: str, item: dict, value, firing: bool):
+        task = asyncio.create_task(self.notify(rule, server, item, value, firing))
+        self._pending.add(task)
+        task.add_done_callback(lambda t: self._notified(t, alert, firing))
+
+    def _notified(self, task: asyncio.Task, alert: tuple, firing: bool):
+        """
+        Logs a notification that failed to post. A firing alert that wasn't
+        posted is no longer active, so it fires again on the next change.
+        """
+        self._pending.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error(f"{alert[1]}: alert '{alert[0]}' could not be posted: {task.exception()!r}")
+        if firing:
+            self.active.pop(alert, None)
+
+    def drop_server(self, server: str):
+        for key in [k for k in self._previous if k[0] == server]:
+            del self._previous[key]
+        for alert in [a for a in self.active if a[1] == server]:
+            del self.active[alert]
+
+
+class EventStream:
+    """
+    Subscribes to the message websocket of each server, reconnecting with
+    exponential backoff, and hands every event to a handler
+    """
+    def __init__(self,
+                 connect,
+                 handler,
+                 event_types: Optional[List[str]] = None):
+        self.connect = connect
+        self.handler = handler
+        self.event_types = event_types or list(DEFAULT_EVENT_TYPES)
+
+        # callables(server, connected) run when a subscription goes up or down
+        self.listeners = []
+        self.connected: Dict[str, bool] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self, servers: List[str]):
+        for server in servers:
+            if server not in self._tasks:
+                self._tasks[server] = asyncio.create_task(self._run(server))
+
+    def stop(self, server: Optional[str] = None):
+        for s in ([server] if server is not None else list(self._tasks)):
+            task = self._tasks.pop(s, None)
+            if task is not None:
+                task.cancel()
+            self.connected.pop(s, None)
+
+    def _set_connected(self, server: str, connected: bool):
+        if self.connected.get(server, False) == connected:
+            return
+        self.connected[server] = connected
+        for listener in self.listeners:
+            listener(server, connected)
+
+    async def _run(self, server: str):
+        backoff = EVENT_BACKOFF_MIN
+        while True:
+            try:
+                async with (await self.connect(server)) as ws:
+                    await ws.send_json({'type': 'subscribe', 'data': self.event_types})
+                    logger.info(f"{server}: subscribed to {len(self.event_types)} event types")
+                    self._set_connected(server, True)
+                    backoff = EVENT_BACKOFF_MIN
+
+                    async for msg in ws:
+                        if msg.type != aiohttp.WSMsgType.TEXT:
+                            break
+                        event = json.loads(msg.data)
+                        try:
+                            await self.handler(server, event.get('type'), event.get('data'))
+                        except Exception as e:
+                            logger.warning(f"{server}: handling '{event.get('type')}' event failed: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.info(f"{server}: message websocket unavailable ({e}), retrying in {backoff}s")
+            else:
+                logger.info(f"{server}: message websocket closed, reconnecting in {backoff}s")
+
+            self._set_connected(server, False)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, EVENT_BACKOFF_MAX)
+
+
+class WatchScheduler:
+    """
+    Keeps messages updated with the latest result of a command. Messages
+    watching the same (server, cmd, args) share one fetch and render per
+    tick, and are only edited when the result has changed.
+    """
+    def __init__(self, produce, max_watches: int = WATCH_MAX):
+        # coroutine function(server, cmd, cmd_args) -> (rendered, data age)
+        self.produce = produce
+        self.max_watches = max_watches
+
+        # (server, cmd, cmd_args) -> {message id: watch}
+        self.groups: Dict[tuple, Dict[int, dict]] = {}
+        self._tasks: Dict[tuple, asyncio.Task] = {}
+
+        self.fetches = 0
+        self.edits = 0
+        self.unchanged = 0
+
+    def count(self) -> int:
+        return sum(len(watches) for watches in self.groups.values())
+
+    def add(self, server: str, cmd: str, cmd_args: list, message, interval: float, digest: str):
+        """
+        Start keeping a message updated
+        :param digest: content_hash() of what the message shows now
+        """
+        key = (server, cmd, tuple(cmd_args))
+        watches = self.groups.setdefault(key, {})
+        next_due = time.monotonic() + interval
+        if watches:
+            # join the group's next tick so it stays one fetch for everyone
+            next_due = min(next_due, min(w['next_due'] for w in watches.values()))
+        watches[message.id] = {
+            'message': message,
+            'interval': interval,
+            'next_due': next_due,
+            'hash': digest,
+        }
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key))
+
+    def watching(self, channel_id: int) -> List[tuple]:
+        return [(key, watch) for key, watches in self.groups.items()
+                for watch in watches.values() if watch['message'].channel.id == channel_id]
+
+    def remove(self, channel_id: int, server: Optional[str] = None, cmd: Optional[str] = None) -> int:
+        """
+        Stop updating the matching messages in a channel
+        :return: Number of messages no longer updated
+        """
+        removed = 0
+        for key, watch in self.watching(channel_id):
+            if (server is None or key[0] == server) and (cmd is None or key[1] == cmd):
+                self._discard(key, watch['message'].id)
+                removed += 1
+        return removed
+
+    def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self.groups.clear()
+
+    def drop_server(self, server: str):
+        for key in [k for k in self.groups if k[0] == server]:
+            for message_id in list(self.groups[key]):
+                self._discard(key, message_id)
+
+    def _discard(self, key: tuple, message_id: int):
+        watches = self.groups.get(key, {})
+        watches.pop(message_id, None)
+        if not watches:
+            self.groups.pop(key, None)
+            task = self._tasks.pop(key, None)
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+
+    async def _run(self, key: tuple):
+        server, cmd, cmd_args = key
+        while self.groups.get(key):
+            watches = self.groups[key]
+            await asyncio.sleep(max(0.0, min(w['next_due'] for w in watches.values()) - time.monotonic()))
+
+            now = time.monotonic()
+            due = [w for w in self.groups.get(key, {}).values() if w['next_due'] <= now + WATCH_SLACK]
+            if not due:
+                continue
+            for watch in due:
+                watch['next_due'] = now + watch['interval']
+
+            try:
+                self.fetches += 1
+                rendered, age = await self.produce(server, cmd, list(cmd_args))
+            except Exception as e:
+                logger.warning(f"{server}: updating watched '{cmd}' failed: {e}")
+                continue
+
+            # hashed before the data age is added, or it would always look changed
+            digest = content_hash(rendered)
+            kwargs = rendered_message(with_data_age(rendered, age))
+            for watch in due:
+                if watch['hash'] == digest:
+                    self.unchanged += 1
+                    continue
+                try:
+                    await watch['message'].edit(**kwargs)
+                    watch['hash'] = digest
+                    self.edits += 1
+                except discord.NotFound:
+                    # the message was deleted, stop watching
+                    self._discard(key, watch['message'].id)
+                except discord.HTTPException as e:
+                    logger.warning(f"Editing watched '{cmd}' message failed: {e}")
+
+        self._tasks.pop(key, None)
+
+
+class TradesStreamDecoder:
+    """
+    Incremental decoder for a /trades response. Each trade is decoded as soon
+    as all of it has arrived and cut down to the rendered fields, and only the
+    last max_trades are kept, so memory doesn't grow with the response size.
+    """
+    ARRAY_START = re.compile(r'"trades"\s*:\s*\[')
+    SEPARATORS = re.compile(r'[\s,]*')
+
+    def __init__(self, max_trades: int, fields: tuple = TRADE_FIELDS):
+        self.trades = deque(maxlen=max_trades)
+        self.fields = fields
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ""
+        # the document before the trades array, and whether the array has ended
+        self._head: Optional[str] = None
+        self._array_done = False
+
+    def feed(self, chunk: bytes):
+        self._buffer += self._text.decode(chunk)
+        if self._head is None:
+            match = self.ARRAY_START.search(self._buffer)
+            if match is None:
+                return
+            self._head = self._buffer[:match.start()]
+            self._buffer = self._buffer[match.end():]
+        if not self._array_done:
+            self._decode_trades()
+
+    def _decode_trades(self):
+        buffer = self._buffer
+        pos = 0
+        while True:
+            pos = self.SEPARATORS.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if buffer[pos] == ']':
+                self._array_done = True
+                pos += 1
+                break
+            try:
+                trade, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # the rest of this trade hasn't arrived yet
+                break
+            self.trades.append({k: trade[k] for k in self.fields if k in trade})
+            pos = end
+        self._buffer = buffer[pos:]
+
+    def close(self) -> dict:
+        """
+        :return: the response, with only the kept trades
+        """
+        self._buffer += self._text.decode(b"", final=True)
+        if self._head is None or not self._array_done:
+            raise Exception("Error: incomplete trades response received.")
+        data = json.loads(f'{self._head}"trades":[]{self._buffer}')
+        data['trades'] = list(self.trades)
+        return data
+
+
+class StaleAge(float):
+    """
+    Age in seconds of data saved before a restart, or kept while its server is unavailable
+    """
+
 
-    @discord.ui.button(label="Refresh")
-    async def refresh(self, interaction, button):
-        js = (await self.cmdfunc(self.server, self.cmd, self.params))
-        embed, refreshable = self.callback(self.server, js, *self.cmd_args)
+class WarmCache:
+    """
+    On-disk copy of the last successful response of each command per server,
+    loaded at startup so a restarted bot can answer before it has reached its
+    servers. New responses are saved in batches from a worker thread.
+    """
+    def __init__(self, path: str, flush_interval: float = WARM_CACHE_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        # only the flush thread writes once the bot is running
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "server TEXT NOT NULL, endpoint TEXT NOT NULL, fetched_at REAL NOT NULL, body BLOB NOT NULL, "
+            "PRIMARY KEY (server, endpoint))"
+        )
+        self.db.commit()
+
+        # server -> endpoint -> (timestamp, data)
+        self.entries: Dict[str, Dict[str, tuple]] = {}
+        # (server, endpoint) loaded from disk and not fetched since
+        self.stale: set = set()
+        self._pending: Dict[tuple, tuple] = {}
+        self._dropped: set = set()
+        self._task = None
+        self._load()
+
+    def _load(self):
+        for server, endpoint, fetched_at, body in self.db.execute(
+                "SELECT server, endpoint, fetched_at, body FROM responses"):
+            try:
+                data = json.loads(zlib.decompress(body))
+            except Exception as e:
+                logger.warning(f"{server}: ignoring unreadable warm cache entry for '{endpoint}': {e}")
+                continue
+            self.entries.setdefault(server, {})[endpoint] = (fetched_at, data)
+            self.stale.add((server, endpoint))
+        logger.info(f"Loaded {len(self.stale)} responses from {self.path}")
+
+    def get(self, server: str, endpoint: str) -> Optional[tuple]:
+        """
+        :return: (data, StaleAge) or None
+        """
+        entry = self.entries.get(server, {}).get(endpoint)
+        if entry is None:
+            return None
+        return entry[1], StaleAge(time.time() - entry[0])
+
+    def record(self, server: str, endpoint: str, data):
+        entry = (time.time(), data)
+        self.entries.setdefault(server, {})[endpoint] = entry
+        self.stale.discard((server, endpoint))
+        self._pending[(server, endpoint)] = entry
+
+    def drop_server(self, server: str):
+        self.entries.pop(server, None)
+        self.stale = {key for key in self.stale if key[0] != server}
+        self._pending = {key: v for key, v in self._pending.items() if key[0] != server}
+        self._dropped.add(server)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending and not self._dropped:
+            return
+        batch, self._pending = self._pending, {}
+        dropped, self._dropped = self._dropped, set()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, batch, dropped)
+        except Exception as e:
+            logger.warning(f"Could not save the warm cache: {e}")
+
+    def _write(self, batch: Dict[tuple, tuple], dropped: set):
+        rows = [(server, endpoint, fetched_at, zlib.compress(json.dumps(data, separators=(',', ':')).encode()))
+                for (server, endpoint), (fetched_at, data) in batch.items()]
+        self.db.executemany("DELETE FROM responses WHERE server = ?", [(server,) for server in dropped])
+        self.db.executemany("INSERT OR REPLACE INTO responses (server, endpoint, fetched_at, body) "
+                            "VALUES (?, ?, ?, ?)", rows)
+        self.db.commit()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        self.db.close()
 
-        await interaction.response.edit_message(
-            embed=embed,
-            view=self
+
+class TradeStore:
+    """
+    Local SQLite copy of each server's closed trade history, synced
+    incrementally using the /trades offset/limit pagination
+    """
+    FIELDS = ('trade_id', 'pair', 'quote_currency', 'open_timestamp', 'close_date',
+              'close_timestamp', 'close_profit', 'close_profit_pct', 'profit_abs', 'stake_amount')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS trades ("
+            "server TEXT NOT NULL, trade_id INTEGER NOT NULL, pair TEXT, quote_currency TEXT, "
+            "open_timestamp INTEGER, close_date TEXT, close_timestamp INTEGER, close_profit REAL, "
+            "close_profit_pct REAL, profit_abs REAL, stake_amount REAL, "
+            "PRIMARY KEY (server, trade_id))"
+        )
+        self.db.commit()
+
+        # bumped whenever a server's stored trades change
+        self.versions: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._arrays: Dict[str, tuple] = {}
+
+    def close(self):
+        self.db.close()
+
+    def count(self, server: str) -> int:
+        return self.db.execute(
+            "SELECT COUNT(*) FROM trades WHERE server = ?", (server,)).fetchone()[0]
+
+    def insert(self, server: str, trades: List[dict]) -> int:
+        before = self.db.total_changes
+        self.db.executemany(
+            f"INSERT OR IGNORE INTO trades (server, {', '.join(self.FIELDS)}) "
+            f"VALUES (?{', ?' * len(self.FIELDS)})",
+            [(server, *(t.get(k) for k in self.FIELDS)) for t in trades]
         )
+        self.db.commit()
+        inserted = self.db.total_changes - before
+        if inserted:
+            self.versions[server] = self.versions.get(server, 0) + 1
+        return inserted
+
+    def clear(self, server: str):
+        self.db.execute("DELETE FROM trades WHERE server = ?", (server,))
+        self.db.commit()
+        self.versions[server] = self.versions.get(server, 0) + 1
+
+    def profit_arrays(self, server: str) -> tuple:
+        """
+        Get the close times (ms) and absolute profits of a server's trades as arrays,
+        reloaded only when the stored trades have changed
+        """
+        version = self.versions.get(server, 0)
+        cached = self._arrays.get(server)
+        if cached is None or cached[0] != version:
+            rows = self.db.execute(
+                "SELECT close_timestamp, profit_abs FROM trades WHERE server = ?",
+                (server,)).fetchall()
+            close_timestamps = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+            profits = np.fromiter((r[1] or 0.0 for r in rows), dtype=np.float64, count=len(rows))
+            cached = (version, close_timestamps, profits)
+            self._arrays[server] = cached
+        return cached[1], cached[2]
+
+    def latest(self, server: str, limit: int, skip: int = 0) -> List[dict]:
+        """
+        Get the most recent trades of a server, oldest first
+        :param limit: Number of trades to return
+        :param skip: Number of most recent trades to skip
+        """
+        rows = self.db.execute(
+            "SELECT * FROM trades WHERE server = ? ORDER BY trade_id DESC LIMIT ? OFFSET ?",
+            (server, limit, skip)).fetchall()
+        return [dict(r) for r in reversed(rows)]
+
+    async def sync(self, server: str, fetch_page) -> int:
+        """
+        Fetch the trades that are not in the store yet
+        :param server: Server name
+        :param fetch_page: Coroutine function taking (offset, limit) and returning a /trades response
+        :return: Number of new trades stored
+        """
+        lock = self._locks.setdefault(server, asyncio.Lock())
+        async with lock:
+            count = self.count(server)
+            inserted, total = await self._sync_from(server, fetch_page,
+                                                    max(0, count - TRADE_SYNC_OVERLAP))
+
+            if self.count(server) != total:
+                # trades were deleted upstream or closed far out of order, start over
+                logger.info(f"{server}: trade store out of step with the bot, resyncing")
+                self.clear(server)
+                inserted, total = await self._sync_from(server, fetch_page, 0)
+
+            if inserted:
+                logger.info(f"{server}: stored {inserted} new trades ({total} in total)")
+            return inserted
+
+    async def _sync_from(self, server: str, fetch_page, offset: int) -> tuple:
+        inserted = 0
+        while True:
+            js = await fetch_page(offset, TRADES_PAGE_SIZE)
+            trades = js['trades']
+            inserted += self.insert(server, trades)
+            offset += len(trades)
+            if len(trades) < TRADES_PAGE_SIZE or offset >= js['total_trades']:
+                return inserted, js['total_trades']
 
 
 class ft_bot(discord.Client):
@@ -86,7 +1654,21 @@ class ft_bot(discord.Client):
     def __init__(self,
                  intents: discord.Intents,
                  servers: dict,
-                 disabled_calls: Optional[List[str]] = None):
+                 disabled_calls: Optional[List[str]] = None,
+                 cache: Optional[dict] = None,
+                 poller: Optional[dict] = None,
+                 trade_store: Optional[str] = None,
+                 warm_cache: Optional[str] = None,
+                 events: Optional[dict] = None,
+                 metrics: Optional[dict] = None,
+                 channels: Optional[List[int]] = None,
+                 ignored_channels: Optional[List[int]] = None,
+                 slash_commands: Optional[dict] = None,
+                 config_path: Optional[str] = None,
+                 log_channel: Optional[int] = None,
+                 workers: Optional[dict] = None,
+                 admission: Optional[dict] = None,
+                 alerts: Optional[dict] = None):
         self.servers = {}
         self.available_calls = {'ping' : self._process_ping,
                                 'show_config' : self._process_show_config,
@@ -96,6 +1678,10 @@ class ft_bot(discord.Client):
                                 'daily' : self._process_daily,
                                 'weekly' : self._process_weekly,
                                 'monthly' : self._process_monthly,}
+        if trade_store is not None:
+            # only answerable from the local trade history
+            self.available_calls.update({'hourly' : self._process_hourly,
+                                         'quarterly' : self._process_quarterly,})
 
         logger.info(f"Available commands: {list(self.available_calls.keys())}")
 
@@ -103,56 +1689,1002 @@ class ft_bot(discord.Client):
         if disabled_calls is not None:
             self.disabled_calls = disabled_calls
             logger.info(f"Disabled commands: {self.disabled_calls}")
+        self._build_commands()
+
+        self.allowed_channels = set(channels or [])
+        self.ignored_channels = set(ignored_channels or [])
+        self.slash_commands = slash_commands
+
+        self.config_path = config_path
+        self.log_channel = log_channel
+        self._config_task = None
+        self._restart_settings = {'cache': cache, 'poller': poller, 'trade_store': trade_store,
+                                  'warm_cache': warm_cache, 'events': events, 'metrics': metrics, 'slash_commands': slash_commands,
+                                  'workers': workers, 'admission': admission, 'alerts': alerts}
+
+        workers = dict(DEFAULT_WORKERS, **(workers or {}))
+        self.json_loads = json.loads
+        if workers['fast_json']:
+            if rapidjson is not None:
+                self.json_loads = rapidjson.loads
+            else:
+                logger.info("python-rapidjson is not installed, using the standard json decoder")
+        self.render_pool: Optional[Executor] = None
+        self.decode_pool: Optional[Executor] = None
+        if workers['size'] > 0:
+            # callbacks need the bot itself, so rendering always stays in this process
+            self.render_pool = ThreadPoolExecutor(max_workers=workers['size'], thread_name_prefix="ft_bot")
+            self.decode_pool = self.render_pool
+            if workers['pool'] == 'process':
+                self.decode_pool = ProcessPoolExecutor(max_workers=workers['size'])
+            logger.info(f"Decoding and rendering in a {workers['pool']} pool of {workers['size']}")
+        self.offload_bytes = workers['min_bytes']
+        self.lag_warning = workers['lag_warning']
+        self._lag_task = None
+
+        cache = cache or {}
+        self.sender = SendQueue()
+        self.admission = AdmissionScheduler(**dict(DEFAULT_ADMISSION, **(admission or {})))
+        self.cache = ResponseCache(max_entries=cache.get('max_entries', DEFAULT_CACHE_SIZE),
+                                   ttls=cache.get('ttl'))
+
+        self.metrics = Metrics()
+        self.watches = WatchScheduler(self._watch_render)
+        self.rendered = RenderRegistry()
+        self.metrics_config = metrics
+        self._metrics_runner = None
+
+        # (server, cmd) -> (store version, current period, timescale, buckets)
+        self._aggregates: Dict[tuple, tuple] = {}
+        # ((server, /status data) for every server, rendered /portfolio)
+        self._portfolio: Optional[tuple] = None
+
+        self.trade_store = None
+        if trade_store is not None:
+            self.trade_store = TradeStore(trade_store)
+            logger.info(f"Storing trade history in {trade_store}")
+
+        self.warm_cache = None
+        if warm_cache is not None:
+            self.warm_cache = WarmCache(warm_cache)
+
+        self.poller = None
+        if poller is not None:
+            self.poller = SnapshotPoller(
+                self._cached_get,
+                endpoints=poller.get('endpoints'),
+                interval=poller.get('interval', DEFAULT_POLL_INTERVAL),
+                max_interval=poller.get('max_interval', DEFAULT_POLL_MAX_INTERVAL),
+                max_age=poller.get('max_age'))
+            if self.trade_store is not None:
+                # profit summaries come from the trade store, polling freqtrade's would only load the bot
+                self.poller.endpoints = [e for e in self.poller.endpoints if e not in TIMEUNITS]
+            logger.info(f"Polling {self.poller.endpoints} every {self.poller.interval}s")
+
+        self.events = None
+        self.events_channel = None
+        if events is not None:
+            self.events_channel = events.get('channel')
+            self.events = EventStream(self._connect_events, self._on_event,
+                                      event_types=events.get('types'))
+            self.events.listeners.append(self._on_events_connected)
+
+        self.alerts = None
+        self.alerts_channel = None
+        if alerts is not None:
+            if self.poller is None:
+                raise Exception("alerts need the poller to be enabled.")
+            self.alerts_channel = alerts.get('channel')
+            self.alerts = AlertEngine([make_alert_rule(r) for r in alerts.get('rules') or []], self._send_alert)
+            for source, endpoint in ALERT_SOURCES.items():
+                if self.alerts.watches(source) and endpoint not in self.poller.endpoints:
+                    self.poller.endpoints.append(endpoint)
+            self.poller.listeners.append(self.alerts.on_snapshot)
+            logger.info(f"Checking {len(self.alerts.rules)} alert rules on every poll")
+
+        for s in servers:
+            if s['name'] == FANOUT_TARGET:
+                raise Exception(f"'{FANOUT_TARGET}' is a reserved server name.")
+            self.servers[s['name']] = self._make_server(s)
+
+        super().__init__(intents=intents)
+        self.tree = app_commands.CommandTree(self)
+
+    def _make_server(self, s: dict) -> dict:
+        server = {}
+        server['spec'] = dict(s)
+        server['ip'] = s['ip']
+        server['port'] = s['port']
+        server['auth'] = aiohttp.BasicAuth(login=s['username'],
+                                           password=s['password'],
+                                           encoding='utf-8')
+        server['limits'] = {k: s.get(k, v) for k, v in DEFAULT_SERVER_LIMITS.items()}
+        server['timeout'] = s.get('timeout', DEFAULT_SERVER_TIMEOUT)
+        server['health'] = ServerHealth(max_timeout=server['timeout'])
+        server['use_jwt'] = s.get('use_jwt', True)
+        server['token_lock'] = asyncio.Lock()
+        server['ws_token'] = s.get('ws_token')
+        server['events_channel'] = s.get('events_channel')
+        if self.warm_cache is not None:
+            saved = self.warm_cache.get(s['name'], 'show_config')
+            if saved is not None:
+                server['config'] = saved[0]
+        return server
+
+    def _build_commands(self):
+        # command name -> handler(channel, cmd, words after the command)
+        self.commands = {'servers': self._show_servers,
+                         'metrics': self._show_metrics,
+                         'help': self._show_help,
+                         'watch': self._watch,
+                         'unwatch': self._unwatch,
+                         'portfolio': self._show_portfolio,
+                         'alerts': self._show_alerts}
+        for cmd in self.available_calls:
+            self.commands[cmd] = (self._command_disabled if cmd in self.disabled_calls
+                                  else self._dispatch_command)
+        names = "|".join(sorted(self.commands, key=len, reverse=True))
+        self.command_pattern = re.compile(rf"{re.escape(CMD_PREFIX_CHAR)}({names})(?:\s|$)")
+
+    async def on_ready(self):
+        logger.info(
+            f'We have logged in as {self.user}. Tracking {len(self.servers)} freqtrade servers'
+        )
+        await self._prefetch_configs(list(self.servers))
+
+    async def _prefetch_configs(self, servers: List[str]):
+        """
+        Fetch the configs of several servers concurrently
+        """
+        started = time.monotonic()
+        await asyncio.gather(*[self._refresh_config(s) for s in servers])
+        loaded = sum(1 for s in servers if s in self.servers and 'config' in self.servers[s])
+        logger.info(f"Loaded {loaded}/{len(servers)} server configs in {time.monotonic() - started:.1f}s")
+
+    async def _refresh_config(self, server: str):
+        # concurrent refreshes of one server share a single fetch
+        srv = self.servers[server]
+        task = srv.get('config_task')
+        if task is None or task.done():
+            task = srv['config_task'] = asyncio.ensure_future(self._fetch_config(server, srv))
+        await asyncio.shield(task)
+
+    async def _fetch_config(self, server: str, srv: dict):
+        self.cache.invalidate(server, 'show_config')
+        try:
+            # stored by _on_response
+            await self._cached_get(server, 'show_config')
+        except Exception as e:
+            srv['config_failures'] = srv.get('config_failures', 0) + 1
+            delay = min(CONFIG_RETRY_MIN * 2 ** (srv['config_failures'] - 1), CONFIG_RETRY_MAX)
+            srv['config_retry_at'] = time.monotonic() + delay
+            logger.warning(f"Could not get config for {server}, retrying in {delay}s: {e}")
+            return
+        srv['config_failures'] = 0
+
+    def _schedule_config_refresh(self, server: str):
+        srv = self.servers[server]
+        if srv.get('config_retry_at', 0) > time.monotonic():
+            return
+        if srv.get('config_task') is None or srv['config_task'].done():
+            asyncio.ensure_future(self._refresh_config(server))
+
+    async def _ensure_config(self, server: str):
+        """
+        Make sure a server's config is known. Old configs are refreshed in the background,
+        and a missing one is only fetched inline once its retry time has passed.
+        """
+        srv = self.servers[server]
+        if 'config' in srv:
+            # configs loaded from the warm cache have no fetch time and are refreshed straight away
+            if srv.get('config_at') is None or time.monotonic() - srv['config_at'] > CONFIG_REFRESH_INTERVAL:
+                self._schedule_config_refresh(server)
+            return
+        if srv.get('config_retry_at', 0) > time.monotonic():
+            return
+        logger.info(f"No config for {server} found - getting...")
+        await self._refresh_config(server)
+
+    def _set_config(self, server: str, config: dict):
+        srv = self.servers.get(server)
+        if srv is None:
+            return
+        old = srv.get('config')
+        srv['config'] = config
+        srv['config_at'] = time.monotonic()
+        if config != old:
+            srv['config_version'] = srv.get('config_version', 0) + 1
+            if old is not None:
+                logger.info(f"{server}: config changed (version {srv['config_version']})")
+
+    def _on_response(self, server: str, endpoint: str, params: dict, js):
+        """
+        Keep server state that depends on the bot's responses up to date
+        """
+        if params or server not in self.servers:
+            return
+        srv = self.servers[server]
+        if endpoint == 'show_config':
+            self._set_config(server, js)
+        elif endpoint == 'status' and 'config' in srv:
+            # a new strategy shows up in the open trades once it has traded
+            strategies = frozenset(t.get('strategy') for t in js)
+            if srv.get('strategies') not in (None, strategies):
+                self._schedule_config_refresh(server)
+            srv['strategies'] = strategies
+        elif endpoint == 'profit' and 'config' in srv:
+            # bots restart to change strategy or config
+            started = js.get('bot_start_timestamp')
+            if srv.get('bot_start') not in (None, started):
+                self._schedule_config_refresh(server)
+            srv['bot_start'] = started
+
+        if (self.warm_cache is not None and endpoint in self.available_calls
+                and not self._summarised_locally(endpoint)):
+            self.warm_cache.record(server, endpoint, js)
+
+    async def setup_hook(self) -> None:
+        # buttons on messages sent before a restart still find their way here
+        self.add_dynamic_items(RefreshButton, PageButton, JumpButton)
+        if self.poller is not None:
+            self.poller.start(list(self.servers))
+        if self.events is not None:
+            self.events.start(list(self.servers))
+        if self.metrics_config is not None:
+            await self._start_metrics_server()
+        if self.slash_commands is not None:
+            await self._sync_slash_commands()
+        if self.config_path is not None:
+            self._config_task = asyncio.create_task(self._watch_config())
+        if self.warm_cache is not None:
+            self.warm_cache.start()
+        self._lag_task = asyncio.create_task(self._monitor_loop_lag())
+
+    async def _monitor_loop_lag(self):
+        """
+        Measure how late the event loop wakes up, and log it when it is late enough
+        to delay commands and gateway heartbeats
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            lag = loop.time() - expected
+            self.metrics.observe('loop_lag', "-", "-", lag)
+            if lag > self.lag_warning:
+                logger.warning(f"Event loop was blocked for {lag * 1000:.0f}ms")
+
+    async def _watch_config(self):
+        """
+        Reload the YAML config whenever the file changes
+        """
+        import yaml
+        mtime = os.stat(self.config_path).st_mtime_ns
+        while True:
+            await asyncio.sleep(CONFIG_POLL_INTERVAL)
+            try:
+                current = os.stat(self.config_path).st_mtime_ns
+            except OSError:
+                continue
+            if current == mtime:
+                continue
+            mtime = current
+
+            try:
+                with open(self.config_path, 'r') as yamlfile:
+                    config = dotdict(yaml.safe_load(yamlfile))
+                summary = await self.reload_config(config)
+            except Exception as e:
+                logger.error(f"Reloading {self.config_path} failed, keeping the running config: {e}")
+                await self._send_log(f"Reloading `{self.config_path}` failed, keeping the running config: {e}")
+                continue
+            logger.info(summary)
+            await self._send_log(summary)
+
+    async def reload_config(self, config: dict) -> str:
+        """
+        Apply a changed config without reconnecting to discord. Only servers
+        whose settings changed are restarted, everything else keeps its
+        sessions, snapshots and caches.
+        :param config: The parsed YAML config
+        :return: Summary of what changed
+        """
+        specs = {s['name']: dict(s) for s in (config.get('servers') or [])}
+        if not specs:
+            raise Exception("No freqtrade servers supplied.")
+        if FANOUT_TARGET in specs:
+            raise Exception(f"'{FANOUT_TARGET}' is a reserved server name.")
+        for name, s in specs.items():
+            missing = [k for k in ('ip', 'port', 'username', 'password') if k not in s]
+            if missing:
+                raise Exception(f"Server '{name}' is missing {missing}.")
+
+        removed = [name for name in self.servers if name not in specs]
+        added = [name for name in specs if name not in self.servers]
+        changed = [name for name in specs if name in self.servers and self.servers[name]['spec'] != specs[name]]
+
+        for name in removed:
+            self.watches.drop_server(name)
+            if self.warm_cache is not None:
+                self.warm_cache.drop_server(name)
+        for name in removed + changed:
+            if self.alerts is not None:
+                self.alerts.drop_server(name)
+            await self._stop_server(name)
+        self.servers = {name: (self._make_server(s) if name in added or name in changed else self.servers[name])
+                        for name, s in specs.items()}
+        if self.poller is not None:
+            self.poller.start(changed + added)
+        if self.events is not None:
+            self.events.start(changed + added)
+        if changed + added:
+            asyncio.create_task(self._prefetch_configs(changed + added))
+
+        lines = []
+        for label, names in (("Added", added), ("Removed", removed), ("Updated", changed)):
+            if names:
+                lines.append(f"{label}: {', '.join(names)}")
+
+        disabled_calls = list(config.get('disabled_calls') or [])
+        if disabled_calls != self.disabled_calls:
+            self.disabled_calls = disabled_calls
+            self._build_commands()
+            lines.append(f"Disabled commands: {', '.join(c for c in disabled_calls if c in self.available_calls) or '-'}")
+            if self.slash_commands is not None:
+                self.tree.clear_commands(guild=None)
+                if self.slash_commands.get('guild') is not None:
+                    self.tree.clear_commands(guild=discord.Object(id=self.slash_commands['guild']))
+                await self._sync_slash_commands()
+
+        self.allowed_channels = set(config.get('channels') or [])
+        self.ignored_channels = set(config.get('ignored_channels') or [])
+        self.log_channel = config.get('log_channel')
+
+        restart = [k for k in RESTART_SETTINGS if config.get(k) != self._restart_settings[k]]
+        if restart:
+            lines.append(f"Changes to {', '.join(restart)} need a restart")
+
+        return "Reloaded config. " + ("; ".join(lines) if lines else "No server changes")
+
+    async def _stop_server(self, name: str):
+        """
+        Stop everything running for a server and drop its cached state
+        """
+        srv = self.servers[name]
+        if self.poller is not None:
+            self.poller.stop(name)
+        if self.events is not None:
+            self.events.stop(name)
+        self.cache.invalidate(name)
+        for key in [k for k in self._aggregates if k[0] == name]:
+            del self._aggregates[key]
+        probe = srv['health'].probe
+        if probe is not None:
+            probe.cancel()
+        session = srv.pop('session', None)
+        if session is not None and not session.closed:
+            logger.info(f"Closing connection pool for {name}")
+            await session.close()
+
+    async def _send_alert(self, rule: AlertRule, server: str, item: dict, value: float, firing: bool):
+        channel_id = self.alerts_channel or self.events_channel
+        channel = self.get_channel(int(channel_id)) if channel_id else None
+        if channel is None:
+            logger.warning(f"{server}: alert '{rule.name}' {'fired' if firing else 'resolved'}, but no alerts channel is set")
+            return
+        await self.sender.send(channel, embed=format_alert(rule, server, item, value, firing))
+
+    async def _send_log(self, text: str):
+        if self.log_channel is None:
+            return
+        channel = self.get_channel(self.log_channel)
+        if channel is None:
+            logger.warning(f"Log channel {self.log_channel} not found")
+            return
+        await self.sender.send(channel, text)
+
+    async def _sync_slash_commands(self):
+        self._add_slash_commands()
+        guild = self.slash_commands.get('guild')
+        try:
+            if guild is not None:
+                # guild commands show up straight away, global ones can take up to an hour
+                self.tree.copy_global_to(guild=discord.Object(id=guild))
+                synced = await self.tree.sync(guild=discord.Object(id=guild))
+            else:
+                synced = await self.tree.sync()
+            logger.info(f"Registered {len(synced)} slash commands")
+        except discord.HTTPException as e:
+            logger.warning(f"Could not register slash commands: {e}")
+
+    async def _start_metrics_server(self):
+        host = self.metrics_config.get('host', DEFAULT_METRICS_HOST)
+        port = self.metrics_config.get('port', DEFAULT_METRICS_PORT)
+
+        async def _serve(request):
+            return web.Response(text=self.metrics.prometheus(self.cache),
+                                content_type='text/plain', charset='utf-8')
+
+        app = web.Application()
+        app.router.add_get('/metrics', _serve)
+        self._metrics_runner = web.AppRunner(app, access_log=None)
+        await self._metrics_runner.setup()
+        await web.TCPSite(self._metrics_runner, host, port).start()
+        logger.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+
+    async def close(self) -> None:
+        if self._config_task is not None:
+            self._config_task.cancel()
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+        for pool in {self.render_pool, self.decode_pool} - {None}:
+            pool.shutdown(wait=False, cancel_futures=True)
+        self.sender.stop()
+        self.watches.stop()
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+        if self.events is not None:
+            self.events.stop()
+        if self.poller is not None:
+            self.poller.stop()
+        if self.trade_store is not None:
+            self.trade_store.close()
+        if self.warm_cache is not None:
+            await self.warm_cache.close()
+        for name, srv in self.servers.items():
+            session = srv.pop('session', None)
+            if session is not None and not session.closed:
+                logger.info(f"Closing connection pool for {name}")
+                await session.close()
+        await super().close()
+
+    def _get_session(self, server: str) -> aiohttp.ClientSession:
+        """
+        Get the long-lived connection pool for a server, creating it on first use
+        """
+        srv = self.servers[server]
+        session = srv.get('session')
+        if session is None or session.closed:
+            limits = srv['limits']
+            connector = aiohttp.TCPConnector(
+                limit=limits['max_connections'],
+                limit_per_host=limits['max_connections'],
+                keepalive_timeout=limits['keepalive_timeout'],
+                use_dns_cache=True,
+                ttl_dns_cache=limits['dns_cache_ttl'],
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'Accept-Encoding': 'gzip, deflate'},
+                auto_decompress=True,
+            )
+            srv['session'] = session
+        return session
+
+    def _base_url(self, server: str) -> str:
+        ip = self.servers[server]['ip']
+        port = self.servers[server]['port']
+        return f"http://{ip}:{port}/api/v1"
+
+    async def _token_request(self, server: str, endpoint: str, **kwargs) -> dict:
+        url = f"{self._base_url(server)}/token/{endpoint}"
+        async with self._get_session(server).post(url, **kwargs) as r:
+            if r.status != 200:
+                raise Exception(f"Token {endpoint} failed: Status {r.status} received.")
+            return await r.json()
+
+    async def _get_token(self, server: str) -> Optional[str]:
+        """
+        Get a valid JWT access token for a server, logging in or refreshing as needed.
+        Returns None if BasicAuth should be used instead.
+        """
+        srv = self.servers[server]
+        if not srv['use_jwt'] or srv.get('token_retry_at', 0) > time.time():
+            return None
+
+        async with srv['token_lock']:
+            now = time.time()
+            tokens = srv.get('tokens')
+            if tokens and tokens['access_expiry'] - TOKEN_REFRESH_MARGIN > now:
+                return tokens['access_token']
+
+            try:
+                if tokens and tokens['refresh_expiry'] - TOKEN_REFRESH_MARGIN > now:
+                    try:
+                        js = await self._token_request(
+                            server, 'refresh',
+                            headers={'Authorization': f"Bearer {tokens['refresh_token']}"})
+                        tokens['access_token'] = js['access_token']
+                        tokens['access_expiry'] = jwt_expiry(js['access_token'])
+                        return tokens['access_token']
+                    except Exception as e:
+                        logger.info(f"{server}: token refresh failed, logging in again ({e})")
+
+                logger.info(f"{server}: logging in for a JWT token")
+                js = await self._token_request(server, 'login', auth=srv['auth'])
+                srv['tokens'] = {
+                    'access_token': js['access_token'],
+                    'access_expiry': jwt_expiry(js['access_token']),
+                    'refresh_token': js['refresh_token'],
+                    'refresh_expiry': jwt_expiry(js['refresh_token']),
+                }
+                return js['access_token']
+            except Exception as e:
+                logger.warning(f"{server}: JWT login failed, falling back to BasicAuth ({e})")
+                srv.pop('tokens', None)
+                srv['token_retry_at'] = time.time() + TOKEN_RETRY_INTERVAL
+                return None
+
+    def _auth_kwargs(self, server: str, token: Optional[str]) -> dict:
+        if token is None:
+            return {'auth': self.servers[server]['auth']}
+        return {'headers': {'Authorization': f"Bearer {token}"}}
+
+    async def _api_get(self, server: str, endpoint: str, params: dict = {},
+                       decoder: Optional[TradesStreamDecoder] = None):
+        health = self.servers[server]['health']
+        await self._check_health(server)
+
+        started = time.monotonic()
+        try:
+            with self.metrics.timed('upstream', server, endpoint.split("/")[0]):
+                js = await asyncio.wait_for(self._api_request(server, endpoint, params, decoder),
+                                            health.timeout())
+        except ApiStatusError as e:
+            if e.status < 500:
+                # the server answered, just not with what we wanted
+                health.record_success(time.monotonic() - started)
+                raise
+            # e.g. a 502 or 504 from a reverse proxy in front of a bot that is down
+            self._record_failure(server, e)
+            raise Exception(f"{server} answered with an error: {health.last_error}") from e
+        except Exception as e:
+            # no answer, or a body that isn't JSON, like the error page of a proxy
+            self._record_failure(server, e)
+            raise Exception(f"{server} did not answer: {health.last_error}") from e
+        health.record_success(time.monotonic() - started)
+        self._on_response(server, endpoint, params, js)
+        return js
+
+    def _record_failure(self, server: str, error: Exception):
+        health = self.servers[server]['health']
+        health.record_failure(error)
+        if health.state == ServerHealth.DOWN:
+            logger.warning(f"{server}: marked down after {health.failures} failures ({health.last_error})")
+
+    async def _check_health(self, server: str):
+        """
+        Fail fast for servers that are down, and let one request at a time
+        probe them with /ping once their retry time has passed
+        """
+        health = self.servers[server]['health']
+        if health.state == ServerHealth.HEALTHY:
+            return
+        if health.state == ServerHealth.DOWN and health.retry_at > time.monotonic():
+            raise Exception(f"{server} is unavailable: {health.status()}")
+
+        if health.probe is None or health.probe.done():
+            health.state = ServerHealth.PROBING
+            health.probe = asyncio.ensure_future(self._probe(server))
+        await asyncio.shield(health.probe)
+        if health.state != ServerHealth.HEALTHY:
+            raise Exception(f"{server} is unavailable: {health.status()}")
+
+    async def _probe(self, server: str):
+        health = self.servers[server]['health']
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._api_request(server, 'ping'), health.max_timeout)
+        except Exception as e:
+            health.record_failure(e)
+            logger.info(f"{server}: still down ({health.last_error})")
+            return
+        health.record_success(time.monotonic() - started)
+        logger.info(f"{server}: back up")
+
+    async def _api_request(self, server: str, endpoint: str, params: dict = {},
+                           decoder: Optional[TradesStreamDecoder] = None):
+        url = f"{self._base_url(server)}/{endpoint}"
+        session = self._get_session(server)
+
+        token = await self._get_token(server)
+        async with session.get(url, params=params, **self._auth_kwargs(server, token)) as r:
+            if r.status == 200:
+                return await self._read_json(server, endpoint, r, decoder)
+            if r.status != 401 or token is None:
+                raise ApiStatusError(r.status)
+
+        # the access token was rejected, log in again and retry once
+        self.servers[server].pop('tokens', None)
+        token = await self._get_token(server)
+        async with session.get(url, params=params, **self._auth_kwargs(server, token)) as r:
+            if r.status == 200:
+                return await self._read_json(server, endpoint, r, decoder)
+            else:
+                raise ApiStatusError(r.status)
+
+    async def _read_json(self, server: str, endpoint: str, r: aiohttp.ClientResponse,
+                         decoder: Optional[TradesStreamDecoder] = None):
+        if decoder is not None:
+            nbytes = 0
+            async for chunk in r.content.iter_chunked(STREAM_CHUNK_SIZE):
+                nbytes += len(chunk)
+                decoder.feed(chunk)
+            self.metrics.payload(server, endpoint.split("/")[0], nbytes)
+            return decoder.close()
+
+        body = await r.read()
+        self.metrics.payload(server, endpoint.split("/")[0], len(body))
+        if self.decode_pool is not None and len(body) >= self.offload_bytes:
+            return await asyncio.get_running_loop().run_in_executor(self.decode_pool, self.json_loads, body)
+        return self.json_loads(body)
+
+    async def _render(self, server: str, cmd: str, data, cmd_args: list) -> tuple:
+        """
+        Run a command's callback, in the render pool if there is one
+        :return: (rendered result, refreshable)
+        """
+        callbackfunc = self.available_calls[cmd]
+        if self.render_pool is None:
+            return callbackfunc(server, data, *cmd_args)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.render_pool, functools.partial(callbackfunc, server, data, *cmd_args))
+
+    async def _cached_get(self, server: str, endpoint: str, params: dict = {},
+                          decoder: Optional[TradesStreamDecoder] = None):
+        key = ResponseCache.make_key(server, endpoint, params)
+        return await self.cache.get(key, lambda: self._api_get(server, endpoint, params, decoder))
+
+    async def _connect_events(self, server: str) -> aiohttp.ClientWebSocketResponse:
+        # freqtrade accepts either its ws_token or a JWT access token
+        token = await self._get_token(server) or self.servers[server]['ws_token']
+        if token is None:
+            raise Exception("no JWT token or ws_token available")
+        url = f"{self._base_url(server).replace('http://', 'ws://')}/message/ws"
+        return await asyncio.wait_for(
+            self._get_session(server).ws_connect(url, params={'token': token}, heartbeat=30),
+            self.servers[server]['timeout'])
+
+    def _on_events_connected(self, server: str, connected: bool):
+        # fills are pushed while subscribed, so /status only needs fetching when they happen,
+        # unless alert rules are watching prices move
+        if self.poller is not None and (self.alerts is None or not self.alerts.watches('trades')):
+            if connected:
+                self.poller.pause(server, 'status')
+            else:
+                self.poller.resume(server, 'status')
+
+    async def _on_event(self, server: str, msg_type: str, data):
+        if msg_type in ('entry_fill', 'exit_fill', 'entry_cancel', 'exit_cancel'):
+            self.cache.invalidate(server, 'status')
+            self.cache.invalidate(server, 'trade')
+
+            if msg_type == 'exit_fill' and not data.get('sub_trade'):
+                # the closed trade leaves the open trades and joins the history
+                self.cache.invalidate(server, 'trades')
+                self.cache.invalidate(server, TRADE_SYNC_KEY)
+                self.cache.invalidate(server, 'profit')
+                if self.poller is not None:
+                    snapshot = self.poller.snapshots.get(server, {}).get('status')
+                    if snapshot is not None:
+                        self.poller.snapshots[server]['status'] = (
+                            snapshot[0], [t for t in snapshot[1] if t['trade_id'] != data.get('trade_id')])
+
+            if self.poller is not None and 'status' in self.poller.endpoints:
+                asyncio.create_task(self.poller.refresh(server, 'status'))
+
+        channel_id = self.servers[server]['events_channel'] or self.events_channel
+        channel = self.get_channel(int(channel_id)) if channel_id else None
+        if channel is not None:
+            await self.sender.send(channel, embed=format_event(server, msg_type, data))
+
+    async def fetch_command(self,
+                            server: str,
+                            command: str,
+                            params: dict = {}) -> tuple:
+        """
+        Get the data for a command, from the poller's snapshot if it has a recent one
+        :return: (data, age of the data in seconds, or None if fetched live)
+        """
+        cmd = command.replace(CMD_PREFIX_CHAR,"")
+        if self.poller is not None:
+            self.poller.touch(server)
+            if (not params and cmd in self.available_calls and cmd not in self.disabled_calls
+                    and not self._summarised_locally(cmd) and 'config' in self.servers[server]):
+                snapshot = self.poller.get(server, cmd)
+                if snapshot is not None:
+                    return snapshot
+
+        if (self.warm_cache is not None and not params and not self._summarised_locally(cmd)
+                and cmd in self.available_calls and cmd not in self.disabled_calls):
+            saved = self.warm_cache.get(server, cmd)
+            if saved is not None and (server, cmd) in self.warm_cache.stale:
+                # answer with what we had before the restart while the live data loads
+                self.warm_cache.stale.discard((server, cmd))
+                asyncio.create_task(self._refresh_stale(server, cmd))
+                return saved
+            try:
+                return (await self.process_command(server, command, params)), None
+            except Exception as e:
+                if saved is None:
+                    raise
+                logger.warning(f"{server}: '{cmd}' failed, answering with the last known data ({e})")
+                return saved
 
-        for s in servers:
-            server = {}
-            server['ip'] = s['ip']
-            server['port'] = s['port']
-            server['auth'] = aiohttp.BasicAuth(login=s['username'],
-                                               password=s['password'],
-                                               encoding='utf-8')
-            self.servers[s['name']] = server
+        return (await self.process_command(server, command, params)), None
 
-        super().__init__(intents=intents)
+    def _summarised_locally(self, cmd: str) -> bool:
+        # freqtrade's own /daily, /weekly and /monthly answers don't match what these commands show then
+        return self.trade_store is not None and cmd in TIMEUNITS
 
-    def _on_ready(self):
-        logger.info(
-            f'We have logged in as {self.user}. Tracking {len(self.servers)} freqtrade servers'
-        )
+    async def _refresh_stale(self, server: str, cmd: str):
+        """
+        Replace data loaded from the warm cache with live data in the background
+        """
+        try:
+            await self.process_command(server, cmd)
+        except Exception as e:
+            logger.info(f"{server}: could not refresh '{cmd}' after starting: {e}")
 
     async def process_command(self,
                               server: str,
                               command: str,
                               params: dict = {}) -> dict:
-        ip = self.servers[server]['ip']
-        port = self.servers[server]['port']
-        auth = self.servers[server]['auth']
-        base_url = f"http://{ip}:{port}/api/v1"
-
-        if 'config' not in self.servers[server]:
-            logger.info(f"No config for {server} found - getting...")
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f'{base_url}/show_config', auth=auth) as r:
-                    if r.status == 200:
-                        self.servers[server]['config'] = await r.json()
+        await self._ensure_config(server)
 
         cmd = command.replace(CMD_PREFIX_CHAR,"")
 
         if cmd in self.available_calls and cmd not in self.disabled_calls:
             # if status and params
             if cmd == 'status' and params and 'trade_id' in params:
-                cmd = f"trade/{params['trade_id'][0]}"
+                return await self._cached_get(server, f"trade/{params['trade_id']}")
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{base_url}/{cmd}", params=params, auth=auth) as r:
-                    if r.status == 200:
-                        js = await r.json()
-                        return js
-                    else:
-                        raise Exception(f"Error: Status {r.status} received.")
+            if cmd == 'trades':
+                return await self._get_latest_trades(server, int(params.get('limit', DEFAULT_NUM_TRADES)))
+
+            if cmd in TIMEUNITS and (self.trade_store is not None or cmd in LOCAL_TIMEUNITS):
+                timescale = int(params.get('timescale', TIMEUNITS[cmd].default))
+                return await self._local_timeunit_profit(server, cmd, timescale)
+
+            return await self._cached_get(server, cmd, params)
         else:
             raise Exception(f"Function '{cmd}' not available or is disabled by the server admin.")
 
+    async def _sync_trade_store(self, server: str):
+        async def _fetch_page(offset, limit):
+            return await self._api_get(server, 'trades', {'limit': limit, 'offset': offset})
+
+        # a cache entry of its own rate limits syncs and shares concurrent ones,
+        # without clashing with cached /trades responses
+        await self.cache.get(ResponseCache.make_key(server, TRADE_SYNC_KEY),
+                             lambda: self.trade_store.sync(server, _fetch_page))
+
+    async def _local_timeunit_profit(self, server: str, cmd: str, timescale: int) -> dict:
+        """
+        Compute a /daily style profit summary from the local trade store,
+        in the same format as freqtrade's /daily, /weekly and /monthly
+        """
+        if self.trade_store is None:
+            raise Exception(f"'{cmd}' needs a trade_store to be configured.")
+        if timescale < 1:
+            raise Exception("timescale must be an integer greater than 0")
+
+        await self._sync_trade_store(server)
+
+        # the current total stake and fiat rate still come from the bot, via its cheapest summary
+        today = await self._cached_get(server, 'daily', {'timescale': 1})
+        stake_currency = today['stake_currency']
+        fiat_display_currency = today['fiat_display_currency']
+        total_stake = today['data'][0]['starting_balance'] + today['data'][0]['abs_profit']
+        fiat_rate = await self._get_fiat_rate(server, today)
+
+        unit = TIMEUNITS[cmd].callback
+        version = self.trade_store.versions.get(server, 0)
+        current = current_period(unit)
+        cached = self._aggregates.get((server, cmd))
+        if cached is not None and cached[:3] == (version, current, timescale):
+            starts, amounts, counts = cached[3]
+        else:
+            close_timestamps, profits = self.trade_store.profit_arrays(server)
+            starts, amounts, counts = bucket_profits(close_timestamps, profits, unit, timescale)
+            self._aggregates[(server, cmd)] = (version, current, timescale, (starts, amounts, counts))
+
+        # balance at the start of each period, walking back from the current total
+        balances = total_stake - np.cumsum(amounts)
+        rel_profits = np.divide(amounts, balances,
+                                out=np.zeros_like(amounts), where=balances > 0)
+        fiat_values = amounts * fiat_rate
+
+        return {
+            'stake_currency': stake_currency,
+            'fiat_display_currency': fiat_display_currency,
+            'data': [
+                {
+                    'date': starts[i],
+                    'abs_profit': float(amounts[i]),
+                    'starting_balance': float(balances[i]),
+                    'rel_profit': float(rel_profits[i]),
+                    'fiat_value': float(fiat_values[i]),
+                    'trade_count': int(counts[i]),
+                }
+                for i in range(timescale)
+            ]
+        }
+
+    async def _get_fiat_rate(self, server: str, today: dict) -> float:
+        period = today['data'][0]
+        if period['abs_profit']:
+            self.servers[server]['fiat_rate'] = period['fiat_value'] / period['abs_profit']
+        elif 'fiat_rate' not in self.servers[server]:
+            balance = await self._cached_get(server, 'balance')
+            self.servers[server]['fiat_rate'] = (
+                balance['value'] / balance['total'] if balance.get('total') else 0.0)
+        return self.servers[server]['fiat_rate']
+
+    async def _count_trades(self, server: str) -> int:
+        """
+        Get the number of closed trades, syncing the local trade store first if enabled
+        """
+        if self.trade_store is not None:
+            await self._sync_trade_store(server)
+            return self.trade_store.count(server)
+        head = await self._cached_get(server, 'trades', {'limit': 1}, TradesStreamDecoder(0))
+        return head['total_trades']
+
+    async def _get_latest_trades(self,
+                                 server: str,
+                                 num_trades: int,
+                                 skip: int = 0,
+                                 total: Optional[int] = None) -> dict:
+        """
+        Get the most recent closed trades, from the local trade store if enabled
+        :param num_trades: Number of trades to get
+        :param skip: Number of most recent trades to skip
+        :param total: Number of closed trades, if already known from _count_trades()
+        """
+        if total is None:
+            total = await self._count_trades(server)
+
+        if self.trade_store is not None:
+            trades = self.trade_store.latest(server, num_trades, skip)
+            return {'trades': trades, 'trades_count': len(trades), 'total_trades': total}
+
+        # the API returns trades oldest first, so count back from the end
+        end = max(0, total - skip)
+        offset = max(0, end - min(num_trades, TRADES_PAGE_SIZE))
+        if end == offset:
+            return {'trades': [], 'trades_count': 0, 'offset': offset, 'total_trades': total}
+        return await self._cached_get(server, 'trades', {'limit': end - offset, 'offset': offset},
+                                      TradesStreamDecoder(end - offset))
+
+    def _is_paginated(self, cmd: str, cmd_args: list) -> bool:
+        return cmd == 'trades' or cmd in TIMEUNITS or (cmd == 'status' and not cmd_args)
+
+    async def _fetch_page(self, server: str, cmd: str, params: dict, page: int) -> tuple:
+        """
+        Get one page of a paginated command's data. Pages past the end of
+        the table, e.g. after it has shrunk, get its last page instead.
+        :return: (data for the page, total number of rows, data age, page number)
+        """
+        if cmd == 'trades':
+            total_trades = await self._count_trades(server)
+            total = min(int(params.get('limit', DEFAULT_NUM_TRADES)), total_trades)
+            page = clamp_page(page, total)
+            start = page * PAGE_SIZE
+            data = await self._get_latest_trades(server, max(0, min(PAGE_SIZE, total - start)), start,
+                                                 total_trades)
+            return data, total, None, page
+
+        data, age = await self.fetch_command(server, cmd, params)
+        rows = data if cmd == 'status' else data['data']
+        page = clamp_page(page, len(rows))
+        start = page * PAGE_SIZE
+        if cmd == 'status':
+            return data[start:start + PAGE_SIZE], len(data), age, page
+        return dict(data, data=data['data'][start:start + PAGE_SIZE]), len(data['data']), age, page
+
+    async def _render_page(self, server: str, cmd: str, params: dict, cmd_args: list, page: int) -> tuple:
+        """
+        Fetch and render one page of a paginated command
+        :return: (rendered page, total pages, page number)
+        """
+        data, total, age, page = await self._fetch_page(server, cmd, params, page)
+        rendered, _ = await self._render(server, cmd, data, cmd_args)
+        return with_data_age(rendered, age), -(-total // PAGE_SIZE), page
+
+    async def _button_allowed(self, interaction, server: str, cmd: str) -> bool:
+        # buttons can outlive a server or command after the config changes
+        if server in self.servers and cmd in self.available_calls and cmd not in self.disabled_calls:
+            return True
+        await interaction.response.send_message("This button is no longer available.", ephemeral=True)
+        return False
+
+    async def refresh_message(self, interaction, server: str, cmd: str, cmd_args: list):
+        """
+        Update a message with the latest result of its command, for its Refresh button
+        """
+        if not await self._button_allowed(interaction, server, cmd):
+            return
+        await interaction.response.defer()
+        requester = (interaction.user.id, interaction.channel_id)
+        slot = await self._admit(server, cmd, cmd_args, requester,
+                                 lambda text: interaction.followup.send(text, ephemeral=True))
+        if slot is None:
+            return
+        try:
+            params = self.parse_command_args(cmd, *cmd_args) if cmd_args else {}
+            if self._is_paginated(cmd, cmd_args):
+                # Refresh is only on single page results, a table that has grown past a page gets paged
+                rendered, total_pages, _ = await self._render_page(server, cmd, params, cmd_args, 0)
+                kwargs = rendered_message(rendered)
+                if total_pages > 1:
+                    kwargs = rendered_message(with_page_number(rendered, 0, total_pages))
+                    view = page_view(server, cmd, cmd_args, 0, total_pages)
+                    if view is not None:
+                        kwargs['view'] = view
+                await interaction.edit_original_response(**kwargs)
+                return
+            js, age = await self.fetch_command(server, cmd, params)
+            rendered, _ = await self._render(server, cmd, js, cmd_args)
+            await interaction.edit_original_response(**rendered_message(with_data_age(rendered, age)))
+        except Exception as e:
+            logger.error(f"{server}: refreshing '{cmd}' failed: {e}")
+            await interaction.followup.send("There was an error. Please check the ft_bot logs.", ephemeral=True)
+        finally:
+            self.admission.release(slot)
+
+    async def show_page(self, interaction, server: str, cmd: str, cmd_args: list, page: int):
+        """
+        Show one page of a paginated command in the message whose button was pressed
+        """
+        if not await self._button_allowed(interaction, server, cmd):
+            return
+        key = (server, cmd, tuple(cmd_args))
+        page = max(page, 0)
+        slot = None
+        if self.rendered.get(key + (page,)) is None:
+            # fetching may take longer than Discord waits for a response
+            await interaction.response.defer()
+            slot = await self._admit(server, cmd, cmd_args, (interaction.user.id, interaction.channel_id),
+                                     lambda text: interaction.followup.send(text, ephemeral=True))
+            if slot is None:
+                return
+        try:
+            rendered, total_pages, page = await self._rendered_page(server, cmd, cmd_args, page)
+        except Exception as e:
+            logger.error(f"{server}: showing page {page + 1} of '{cmd}' failed: {e}")
+            if not interaction.response.is_done():
+                await interaction.response.defer()
+            await interaction.followup.send("There was an error. Please check the ft_bot logs.", ephemeral=True)
+            return
+        finally:
+            if slot is not None:
+                self.admission.release(slot)
+
+        kwargs = rendered_message(rendered)
+        kwargs['view'] = page_view(server, cmd, cmd_args, page, total_pages)
+        if interaction.response.is_done():
+            await interaction.edit_original_response(**kwargs)
+        else:
+            await interaction.response.edit_message(**kwargs)
+
+    async def _rendered_page(self, server: str, cmd: str, cmd_args: list, page: int) -> tuple:
+        """
+        Render one page, or take it from the registry if it was rendered recently
+        :return: (rendered page, total pages, page number)
+        """
+        key = (server, cmd, tuple(cmd_args), page)
+        cached = self.rendered.get(key)
+        if cached is not None:
+            return cached
+        params = self.parse_command_args(cmd, *cmd_args) if cmd_args else {}
+        rendered, total_pages, shown = await self._render_page(server, cmd, params, cmd_args, page)
+        result = (with_page_number(rendered, shown, total_pages), total_pages, shown)
+        self.rendered.put(key, result)
+        if shown != page:
+            self.rendered.put(key[:-1] + (shown,), result)
+        return result
+
     def _process_ping(self, server, data, *command_args):
         """
         */ping <server>* : Ping the bot
@@ -175,7 +2707,8 @@ class ft_bot(discord.Client):
 
         markdown_msg = f"**{server} - Profit Summary**\n"
 
-        stake_cur = self.servers[server]['config']['stake_currency']
+        # the config can be missing while its server is failing to return it
+        stake_cur = self.servers[server].get('config', {}).get('stake_currency', "")
         # fiat_disp_cur = self.servers[server]['config'].get('fiat_display_currency', '') # TODO FIX RPC Profit model
 
         profit_closed_coin = data['profit_closed_coin']
@@ -258,12 +2791,12 @@ class ft_bot(discord.Client):
                         ]
                     )
                 table = tabulate(msg, headers='firstrow', tablefmt='outline')
-                return discord.Embed(description=f"```{table}```")
+                return discord.Embed(description=f"```{table}```"), True
             else:
                 # embeds = []
                 r = data
 
-                position_adjust = self.servers[server]['config']['position_adjustment_enable']
+                position_adjust = self.servers[server].get('config', {}).get('position_adjustment_enable', False)
 
                 msg = ""
 
@@ -294,13 +2827,18 @@ class ft_bot(discord.Client):
                     f"*Exit Reason:* `{exit_reason}`" if r['exit_reason'] else "",
                 ]
 
-                # if position_adjust:
-                #     max_entries = r['max_entry_position_adjustment']
-                #     max_buy_str = (f"/{max_entries + 1}" if (max_entries > 0) else "")
-                #     lines.extend([
-                #         "*Number of Entries:* `{num_entries}" + max_buy_str + "`",
-                #         "*Number of Exits:* `{num_exits}`"
-                #     ])
+                ladder = order_ladder(r['orders'], r.get('fee_open') or 0.0, r.get('is_short', False),
+                                      r['current_rate'] if r['is_open'] else None)
+                if position_adjust:
+                    max_entries = r.get('max_entry_position_adjustment', -1)
+                    max_buy_str = (f"/{max_entries + 1}" if (max_entries > 0) else "")
+                    stake = r['max_stake_amount'] or r['stake_amount']
+                    lines.extend([
+                        f"*Number of Entries:* `{ladder['num_entries']}{max_buy_str}`",
+                        f"*Number of Exits:* `{ladder['num_exits']}`",
+                        f"*Average Entry incl. Fees:* `{ladder['fee_average']:.8f}`",
+                        f"*Effective Leverage:* `{ladder['entry_cost'] / stake:.2f}x`" if stake else "",
+                    ])
 
                 lines.extend([
                     f"*Open Rate:* `{r['open_rate']:.8f}`",
@@ -338,7 +2876,7 @@ class ft_bot(discord.Client):
                             + f"- `{r['exit_order_status']}`" if r['exit_order_status'] else "")
 
                 lines_detail = self._prepare_order_details(
-                    r['orders'], r['quote_currency'], r['is_open'])
+                    r['orders'], r['quote_currency'], r['is_open'], ladder)
                 lines.extend(lines_detail if lines_detail else "")
 
                 for line in lines:
@@ -352,62 +2890,37 @@ class ft_bot(discord.Client):
         else:
             return f"`No active trades`", False
 
-    def _prepare_order_details(self, filled_orders: List, quote_currency: str, is_open: bool):
+    def _prepare_order_details(self, filled_orders: List, quote_currency: str, is_open: bool,
+                               ladder: Optional[dict] = None):
         """
         Prepare details of trade with entry adjustment enabled
+        :param ladder: order_ladder() of the orders, if already computed
         """
+        if ladder is None:
+            ladder = order_ladder(filled_orders)
+        profits = ladder['profits']
+        now = arrow.utcnow()
         lines_detail: List[str] = []
-        if len(filled_orders) > 0:
-            first_avg = filled_orders[0]["safe_price"]
-        order_nr = 0
-        for order in filled_orders:
-            lines: List[str] = []
-            if order['is_open'] is True:
-                continue
-            order_nr += 1
-            # wording = 'Entry' if order['ft_is_entry'] else 'Exit'
-
-            cur_entry_datetime = arrow.get(order["order_filled_timestamp"])
-            cur_entry_amount = order["filled"] or order["amount"]
-            cur_entry_average = order["safe_price"]
-            lines.append("  ")
+        orders = [o for o in filled_orders if o['is_open'] is not True]
+        for i, order in enumerate(orders):
+            order_nr = i + 1
+            lines: List[str] = ["  "]
+            amount = order["filled"] or order["amount"]
+            cost = round_coin_value(order['cost'], quote_currency)
             if order_nr == 1:
-                # lines.append(f"*{wording} #{order_nr}:*")
                 lines.append(f"*#{order_nr}:*")
-                lines.append(
-                    f"*Amount:* `{cur_entry_amount} "
-                    f"({round_coin_value(order['cost'], quote_currency)})`"
-                )
-                lines.append(f"*Average Price:* `{cur_entry_average}`")
+                lines.append(f"*Amount:* `{amount} ({cost})`")
+                lines.append(f"*Average Price:* `{order['safe_price']}`")
             else:
-                sum_stake = 0
-                sum_amount = 0
-                for y in range(order_nr):
-                    loc_order = filled_orders[y]
-                    if loc_order['is_open'] is True:
-                        # Skip open orders (e.g. stop orders)
-                        continue
-                    amount = loc_order["filled"] or loc_order["amount"]
-                    sum_stake += amount * loc_order["safe_price"]
-                    sum_amount += amount
-                prev_avg_price = sum_stake / sum_amount
-                # TODO: This calculation ignores fees.
-                price_to_1st_entry = ((cur_entry_average - first_avg) / first_avg)
-                minus_on_entry = 0
-                if prev_avg_price:
-                    minus_on_entry = (cur_entry_average - prev_avg_price) / prev_avg_price
-
-                # lines.append(f"*{wording} #{order_nr}:* at {minus_on_entry:.2%} avg Profit")
-                lines.append(f"*#{order_nr}:* at {minus_on_entry:.2%} avg Profit")
+                lines.append(f"*#{order_nr}:* at {ladder['from_average'][i]:.2%} avg Profit")
                 if is_open:
-                    lines.append("({})".format(cur_entry_datetime
-                                               .humanize(granularity=["day", "hour", "minute"])))
-                lines.append(f"*Amount:* {cur_entry_amount} "
-                             f"({round_coin_value(order['cost'], quote_currency)})")
-                # lines.append(f"*Average {wording} Price:* {cur_entry_average} "
-                lines.append(f"*Average Price:* {cur_entry_average} "
-                             f"({price_to_1st_entry:.2%} from 1st entry Rate)")
-                # lines.append(f"*Order filled:* {order['order_filled_date']}")
+                    lines.append("({})".format(arrow.get(order["order_filled_timestamp"])
+                                               .humanize(now, granularity=["day", "hour", "minute"])))
+                lines.append(f"*Amount:* {amount} ({cost})")
+                lines.append(f"*Average Price:* {order['safe_price']} "
+                             f"({ladder['from_first'][i]:.2%} from 1st entry Rate)")
+            if profits is not None:
+                lines.append(f"*Fill Profit:* {profits[i]:.2%}")
 
             lines_detail.append("\n".join(lines))
 
@@ -420,7 +2933,7 @@ class ft_bot(discord.Client):
         """
         if data and len(data) > 0:
             if len(command_args) == 0:
-                num_trades = 10
+                num_trades = DEFAULT_NUM_TRADES
             else:
                 num_trades = int(command_args[0])
 
@@ -440,20 +2953,21 @@ class ft_bot(discord.Client):
                 )
             table = tabulate(msg, headers='firstrow', tablefmt='outline')
 
+            # embed descriptions fit a full page of long pairs and unrounded profits
             message = (
                 f'**{server} - {num_trades} recent trades**:\n'
                 f'```{table}```'
             )
-            return f"{message}", False
+            return discord.Embed(description=message), False
 
         return f"No trades to show", False
 
-    def _process_daily(self, server, data, *command_args):
+    def _timeunit_stats(self, server, data, cmd, *command_args):
         """
-        */daily <server>* : Show the last 12 days profit summary
-        */daily <server> <limit>* : Show the last <limit> days profit summary
+        Render a profit summary per time unit
         """
-        num_days = int(command_args[0]) if len(command_args) > 0 else 12
+        mapping = TIMEUNITS[cmd]
+        num_units = int(command_args[0]) if len(command_args) > 0 else mapping.default
 
         stats_tab = tabulate(
             [[f"{period['date']} ({period['trade_count']})",
@@ -462,72 +2976,52 @@ class ft_bot(discord.Client):
               f"{period['rel_profit']:.2%}",
               ] for period in data['data']],
             headers=[
-                f"Daily (count)",
+                f"{mapping.header} (count)",
                 f"{data['stake_currency']}",
                 f"{data['fiat_display_currency']}",
                 'Profit %',
-                'Trades',
             ],
             tablefmt='outline')
         message = (
-            f'**{server} - Profit over the last {num_days} days**:\n'
+            f'**{server} - Profit over the last {num_units} {mapping.message2}**:\n'
             f'```{stats_tab}```'
         )
-        return f"{message}", False
+        return discord.Embed(description=message), False
+
+    def _process_hourly(self, server, data, *command_args):
+        """
+        */hourly <server>* : Show the last 24 hours profit summary
+        */hourly <server> <limit>* : Show the last <limit> hours profit summary
+        """
+        return self._timeunit_stats(server, data, 'hourly', *command_args)
+
+    def _process_daily(self, server, data, *command_args):
+        """
+        */daily <server>* : Show the last 12 days profit summary
+        */daily <server> <limit>* : Show the last <limit> days profit summary
+        """
+        return self._timeunit_stats(server, data, 'daily', *command_args)
 
     def _process_weekly(self, server, data, *command_args):
         """
         */weekly <server>* : Show the last 12 weeks profit summary
         */weekly <server> <limit>* : Show the last <limit> weeks profit summary
         """
-        num_weeks = int(command_args[0]) if len(command_args) > 0 else 12
-
-        stats_tab = tabulate(
-            [[f"{period['date']} ({period['trade_count']})",
-              f"{round_coin_value(period['abs_profit'], data['stake_currency'])}",
-              f"{period['fiat_value']:.2f} {data['fiat_display_currency']}",
-              f"{period['rel_profit']:.2%}",
-              ] for period in data['data']],
-            headers=[
-                f"Monthly (count)",
-                f"{data['stake_currency']}",
-                f"{data['fiat_display_currency']}",
-                'Profit %',
-                'Trades',
-            ],
-            tablefmt='outline')
-        message = (
-            f'**{server} - Profit over the last {num_weeks} weeks**:\n'
-            f'```{stats_tab}```'
-        )
-        return f"{message}", False
+        return self._timeunit_stats(server, data, 'weekly', *command_args)
 
     def _process_monthly(self, server, data, *command_args):
         """
         */monthly <server>* : Show the last 12 months profit summary
         */monthly <server> <limit>* : Show the last <limit> months profit summary
         """
-        num_months = int(command_args[0]) if len(command_args) > 0 else 12
+        return self._timeunit_stats(server, data, 'monthly', *command_args)
 
-        stats_tab = tabulate(
-            [[f"{period['date']} ({period['trade_count']})",
-              f"{round_coin_value(period['abs_profit'], data['stake_currency'])}",
-              f"{period['fiat_value']:.2f} {data['fiat_display_currency']}",
-              f"{period['rel_profit']:.2%}",
-              ] for period in data['data']],
-            headers=[
-                f"Monthly (count)",
-                f"{data['stake_currency']}",
-                f"{data['fiat_display_currency']}",
-                'Profit %',
-                'Trades',
-            ],
-            tablefmt='outline')
-        message = (
-            f'**{server} - Profit over the last {num_months} months**:\n'
-            f'```{stats_tab}```'
-        )
-        return f"{message}", False
+    def _process_quarterly(self, server, data, *command_args):
+        """
+        */quarterly <server>* : Show the last 4 quarters profit summary
+        */quarterly <server> <limit>* : Show the last <limit> quarters profit summary
+        """
+        return self._timeunit_stats(server, data, 'quarterly', *command_args)
 
     def _process_show_config(self, server, data, *command_args):
         """
@@ -569,97 +3063,474 @@ class ft_bot(discord.Client):
 
         return discord.Embed(description=msg), False
 
+    async def _fanout_command(self, cmd: str, cmd_args: list, params: dict = {}) -> List[Embed]:
+        """
+        Run a command against every server concurrently and merge the results
+        into as few embeds as the Discord limits allow
+        """
+        async def _query(server):
+            timeout = self.servers[server]['timeout']
+            try:
+                with self.metrics.timed('fetch', server, cmd):
+                    js, age = await asyncio.wait_for(self.fetch_command(server, cmd, params), timeout)
+                with self.metrics.timed('render', server, cmd):
+                    rendered, _ = await self._render(server, cmd, js, cmd_args)
+                return server, rendered_text(with_data_age(rendered, age)), True
+            except asyncio.TimeoutError:
+                return server, f"Timed out after {timeout}s", False
+            except Exception as e:
+                logger.warning(f"{server}: '{cmd}' failed during fan-out: {e}")
+                return server, f"{e}", False
+
+        results = await asyncio.gather(*[_query(s) for s in self.servers])
+
+        embeds = []
+        embed = None
+        for server, text, ok in results:
+            name = f"{server}" if ok else f"{server} (unavailable)"
+            value = truncate_block(text or "-", EMBED_FIELD_LIMIT)
+            if (embed is None
+                    or len(embed.fields) >= EMBED_MAX_FIELDS
+                    or len(embed) + len(name) + len(value) > EMBED_TOTAL_LIMIT):
+                embed = discord.Embed(title=f"{cmd} - {FANOUT_TARGET} servers", color=Color.green())
+                embeds.append(embed)
+            if not ok:
+                embed.color = Color.orange()
+            embed.add_field(name=name, value=value, inline=False)
+
+        return embeds
+
     async def on_message(self, message) -> None:
+        # cheapest checks first, most messages the bot sees are not commands for it
+        channel_id = message.channel.id
+        if channel_id in self.ignored_channels:
+            return
+        if self.allowed_channels and channel_id not in self.allowed_channels:
+            return
+        match = self.command_pattern.match(message.content)
+        if match is None:
+            return
+
         # don't let the bot reply to itself or other bots
         if message.author == self.user or message.author.bot:
             return
 
-        cmd_string = message.content.split(" ")
-        command = cmd_string[0]
-        cmd = command.replace(CMD_PREFIX_CHAR,"")
-
-        if cmd.startswith('servers'):
-            resp = []
-            headers = ["NAME","IP","PORT"]
-            resp.append(headers)
-
-            for k,v in self.servers.items():
-                resp.append([k,v['ip'],v['port']])
-            table = tabulate(resp,headers='firstrow',tablefmt='grid')
-            await message.channel.send(f"```{table}```")
-        elif cmd.startswith('help'):
-            msg = f"**Available commands:**\n"
-            for k,v in self.available_calls.items():
+        cmd = match.group(1)
+        REQUESTER.set((message.author.id, channel_id))
+        await self.commands[cmd](message.channel, cmd, message.content.split()[1:])
+
+    async def _show_servers(self, channel, cmd: str, words: list):
+        resp = []
+        headers = ["NAME","IP","PORT","HEALTH","CONFIG"]
+        resp.append(headers)
+
+        for k,v in self.servers.items():
+            resp.append([k,v['ip'],v['port'],v['health'].status(),config_status(v)])
+        table = tabulate(resp,headers='firstrow',tablefmt='grid')
+        await self.sender.send(channel,
+                               f"```{table}```\n*Response cache:* `{self.cache.stats()}`\n"
+                               f"*Commands:* `{self.admission.stats()}`")
+
+    async def _show_metrics(self, channel, cmd: str, words: list):
+        await self.sender.send(channel, self.metrics.summary(self.cache))
+
+    async def _show_help(self, channel, cmd: str, words: list):
+        msg = f"**Available commands:**\n"
+        for k,v in self.available_calls.items():
+            if k not in self.disabled_calls:
                 msg += f"{v.__doc__}"
-            await message.channel.send(embed=discord.Embed(description=msg))
-        else:
-            cmd_args = []
-            params = {}
+        msg += f"{self._watch.__doc__}{self._unwatch.__doc__}{self._show_portfolio.__doc__}{self._show_alerts.__doc__}"
+        await self.sender.send(channel, embed=discord.Embed(description=msg))
+
+    async def _show_alerts(self, channel, cmd: str, words: list):
+        """
+        */alerts* : List the alerts that are firing
+        """
+        if self.alerts is None:
+            await self.sender.send(channel, "No alert rules are configured.")
+            return
+        rows = [[server, name, key if key is not None else "-", f"{value:g}",
+                 arrow.get(fired).humanize()]
+                for (name, server, key), (fired, value) in sorted(self.alerts.active.items(), key=lambda a: a[1][0])]
+        if not rows:
+            await self.sender.send(channel, f"No alerts firing ({len(self.alerts.rules)} rules).")
+            return
+        table = tabulate(rows, headers=["SERVER", "RULE", "TRADE", "VALUE", "SINCE"], tablefmt='simple')
+        await self.sender.send(channel, f"```\n{table}```")
+
+    async def _show_portfolio(self, channel, cmd: str, words: list):
+        """
+        */portfolio* : Show the combined exposure of the open trades on every server
+        """
+        if 'status' in self.disabled_calls:
+            await self.sender.send(channel, "Function 'portfolio' needs 'status', which is disabled by the server admin.")
+            return
+        requester = REQUESTER.get() or (None, channel.id)
+        slot = await self._admit(FANOUT_TARGET, cmd, words, requester, lambda text: self.sender.send(channel, text))
+        if slot is None:
+            return
+        try:
+            embed = await self._render_portfolio()
+        finally:
+            self.admission.release(slot)
+        await self.sender.send(channel, embed=embed)
+
+    async def _render_portfolio(self) -> Embed:
+        """
+        Get /status from every server concurrently and render their combined exposure,
+        reusing the last result while no server's /status data has changed
+        """
+        async def _query(server):
+            timeout = self.servers[server]['timeout']
             try:
-                if len(self.servers) == 1:
-                    server = list(self.servers.keys())[0]
-                    if len(cmd_string) > 1:
-                        cmd_args = cmd_string[1:]
-                else:
-                    if len(cmd_string) > 1:
-                        server = cmd_string[1]
-                        if server not in self.servers:
-                            await message.channel.send((
-                                f"More than one server available, but no server specified. Use:\n"
-                                f"{self.available_calls[cmd].__doc__}"
-                            ))
-                            return None
-                    else:
-                        await message.channel.send((
-                            f"More than one server available, but no server specified. Use:\n"
-                            f"{self.available_calls[cmd].__doc__}"
-                        ))
-                        return None
-
-                    if len(cmd_string) > 2:
-                        cmd_args = cmd_string[2:]
-                        params = self.parse_command_args(cmd, cmd_args)
-
-                cmdfunc = self.process_command
-                js = (await cmdfunc(server, cmd, params))
-
-                callbackfunc = self.available_calls[cmd]
-                embed, refreshable = callbackfunc(server, js, *cmd_args)
-
-                view = None
-                if refreshable:
-                    view = RefreshableView(
-                        cmdfunc,
-                        cmd_args,
-                        callbackfunc,
-                        server,
-                        cmd,
-                        params
-                    )
+                js, _ = await asyncio.wait_for(self.fetch_command(server, 'status'), timeout)
+                return server, js
+            except asyncio.TimeoutError:
+                logger.warning(f"{server}: 'status' timed out after {timeout}s for portfolio")
+            except Exception as e:
+                logger.warning(f"{server}: 'status' failed for portfolio: {e}")
+            return server, None
+
+        sources = await asyncio.gather(*[_query(s) for s in self.servers])
+        # cached and polled data is only replaced, never changed in place, so holding on
+        # to it and comparing by identity tells whether anything changed
+        if self._portfolio is not None and len(self._portfolio[0]) == len(sources) and all(
+                a[0] == b[0] and a[1] is b[1] for a, b in zip(self._portfolio[0], sources)):
+            return self._portfolio[1]
+
+        trades = [t for _, js in sources if js for t in js]
+        origins = [server for server, js in sources if js for _ in js]
+        unavailable = [server for server, js in sources if js is None]
+        embed = discord.Embed(title=f"Portfolio - {len(trades)} open trades on "
+                                    f"{len(sources) - len(unavailable)} servers",
+                              color=Color.orange() if unavailable else Color.green())
+        if trades:
+            p = portfolio_exposure(trades, origins)
+            quote_rows = [[quote, count,
+                           round_coin_value(net, quote, False), round_coin_value(gross, quote, False),
+                           round_coin_value(pnl, quote, False)]
+                          for quote, count, net, gross, pnl in zip(
+                              p['quotes'], p['quote_trades'], p['quote_net'], p['quote_gross'], p['quote_pnl'])]
+            pair_rows = [[p['pairs'][i], p['pair_bots'][i], p['pair_trades'][i],
+                          round_coin_value(p['pair_net'][i], p['pair_quotes'][i], False),
+                          f"{p['pair_share'][i]:.1%}",
+                          round_coin_value(p['pair_pnl'][i], p['pair_quotes'][i], False)]
+                         for i in p['order'][:PORTFOLIO_TOP_PAIRS]]
+            embed.description = (
+                f"**Exposure per quote currency:**\n```\n"
+                f"{tabulate(quote_rows, headers=['QUOTE', 'TRADES', 'NET', 'GROSS', 'UNREALIZED'], tablefmt='simple')}```\n"
+                f"**Largest positions:**\n```\n"
+                f"{tabulate(pair_rows, headers=['PAIR', 'BOTS', 'TRADES', 'NET', 'SHARE', 'UNREALIZED'], tablefmt='simple')}```"
+            )
+        else:
+            embed.description = "`No active trades`"
+        if unavailable:
+            embed.set_footer(text=f"Unavailable: {', '.join(unavailable)}")
+
+        self._portfolio = (sources, embed)
+        return embed
+
+    async def _watch(self, channel, cmd: str, words: list):
+        """
+        */watch <server> <cmd> <interval> <args>* : Keep a message updated with a command every <interval> seconds
+        */watch* : List the watched commands in this channel
+        """
+        # slash commands only have a short-lived token, so post the dashboard to the channel itself
+        target = channel.interaction.channel if isinstance(channel, InteractionChannel) else channel
+        if not words:
+            rows = [[key[0], " ".join((key[1],) + key[2]), f"{watch['interval']:.0f}s"]
+                    for key, watch in self.watches.watching(target.id)]
+            if not rows:
+                await self.sender.send(channel, "Nothing is being watched in this channel.")
+                return
+            table = tabulate(rows, headers=["SERVER", "CMD", "EVERY"], tablefmt='simple')
+            await self.sender.send(channel, f"```\n{table}```")
+            return
+
+        server, rest = self._resolve_server(words)
+        if server is None or not rest:
+            await self.sender.send(channel, f"Use:\n{self._watch.__doc__}")
+            return
+        watched, cmd_args = rest[0], rest[1:]
+        if watched not in self.available_calls or watched in self.disabled_calls:
+            await self.sender.send(channel, f"Function '{watched}' not available.")
+            return
+        if self.watches.count() >= self.watches.max_watches:
+            await self.sender.send(channel, f"Already watching {self.watches.max_watches} commands, /unwatch some first.")
+            return
+
+        interval = WATCH_DEFAULT_INTERVAL
+        if cmd_args and cmd_args[0].isdigit():
+            interval = max(int(cmd_args[0]), WATCH_MIN_INTERVAL)
+            cmd_args = cmd_args[1:]
+
+        try:
+            rendered, age = await self._watch_render(server, watched, cmd_args)
+            digest = content_hash(rendered)
+            kwargs = rendered_message(with_data_age(rendered, age))
+            message = await self.sender.send(target, kwargs['content'], embeds=kwargs['embeds'])
+        except Exception as e:
+            await self.sender.send(channel, f"There was an error. Please check the ft_bot logs.")
+            logger.error(f"Watching '{watched}' on {server} failed: {e}")
+            return
+
+        if message is not None:
+            self.watches.add(server, watched, cmd_args, message, interval, digest)
+        if target is not channel:
+            await self.sender.send(channel, f"Watching '{watched}' on {server} every {interval}s.")
+
+    async def _unwatch(self, channel, cmd: str, words: list):
+        """
+        */unwatch* : Stop updating all watched commands in this channel
+        */unwatch <server> <cmd>* : Stop updating a watched command in this channel
+        """
+        target = channel.interaction.channel if isinstance(channel, InteractionChannel) else channel
+        server = words[0] if words else None
+        watched = words[1] if len(words) > 1 else None
+        removed = self.watches.remove(target.id, server, watched)
+        await self.sender.send(channel, f"Stopped {removed} watched command{'s' if removed != 1 else ''}.")
+
+    async def _watch_render(self, server: str, cmd: str, cmd_args: list) -> tuple:
+        """
+        Fetch and render a command for /watch
+        :return: (rendered result, data age or None)
+        """
+        params = self.parse_command_args(cmd, *cmd_args) if cmd_args else {}
+        if server == FANOUT_TARGET:
+            return (await self._fanout_command(cmd, cmd_args, params)), None
+        if self._is_paginated(cmd, cmd_args):
+            # only the first page, like the message the command itself sends
+            js, total, age, _ = await self._fetch_page(server, cmd, params, 0)
+            rendered, _ = await self._render(server, cmd, js, cmd_args)
+            if total > PAGE_SIZE:
+                rendered = with_page_number(rendered, 0, -(-total // PAGE_SIZE))
+            return rendered, age
+        js, age = await self.fetch_command(server, cmd, params)
+        rendered, _ = await self._render(server, cmd, js, cmd_args)
+        return rendered, age
+
+    async def _command_disabled(self, channel, cmd: str, words: list):
+        await self.sender.send(channel, f"Function '{cmd}' is disabled by the server admin.")
+
+    async def _dispatch_command(self, channel, cmd: str, words: list):
+        started = time.perf_counter()
+        server, cmd_args = self._resolve_server(words)
+        if server is None:
+            await self.sender.send(channel, (
+                f"More than one server available, but no server specified. Use:\n"
+                f"{self.available_calls[cmd].__doc__}"
+            ))
+            return None
+        await self._run_command(channel, server, cmd, cmd_args, started)
+
+    def _resolve_server(self, words: list) -> tuple:
+        """
+        Split the words after a command into the server it is for and its arguments
+        :return: (server name, FANOUT_TARGET or None if no server was named, remaining arguments)
+        """
+        if words and words[0] == FANOUT_TARGET:
+            return FANOUT_TARGET, words[1:]
+        if len(self.servers) == 1:
+            server = next(iter(self.servers))
+            # naming the only server is optional
+            if words and words[0] == server:
+                words = words[1:]
+            return server, words
+        if words and words[0] in self.servers:
+            return words[0], words[1:]
+        return None, words
+
+    async def _admit(self, server: str, cmd: str, cmd_args: list, requester, reply) -> Optional[tuple]:
+        """
+        Wait until a command may run, telling the requester if it has to wait
+        :param server: Server name, or FANOUT_TARGET to count the command against every server
+        :param reply: Coroutine function to send a short message to the requester
+        :return: The servers to release once the command is done, or None if it was turned away
+        """
+        async def _queued(waiting: int):
+            await reply(f"Busy, your '{cmd}' is queued with {waiting - 1} other commands and will run shortly.")
 
-                if embed is not None:
+        servers = tuple(self.servers) if server == FANOUT_TARGET else (server,)
+        queued = time.perf_counter()
+        try:
+            admitted = await self.admission.acquire(servers, requester, command_priority(cmd, cmd_args), _queued)
+        except Exception as e:
+            traceback.print_exc()
+            logger.error(f"{server}: queueing '{cmd}' failed: {e}")
+            await reply("There was an error. Please check the ft_bot logs.")
+            return None
+        if not admitted:
+            await reply(f"You already have {self.admission.max_queued} commands waiting here, "
+                        f"please wait for them before sending more.")
+            return None
+        self.metrics.observe('queue', server, cmd, time.perf_counter() - queued)
+        return servers
+
+    async def _run_command(self,
+                           channel,
+                           server: str,
+                           cmd: str,
+                           cmd_args: list,
+                           started: Optional[float] = None):
+        """
+        Fetch, render and send the result of a command, once the admission scheduler lets it run
+        :param channel: Discord channel, or anything else with the same send(), to reply to
+        :param server: Server name, or FANOUT_TARGET for all servers
+        :param started: When the command was received, for the parse metric
+        """
+        requester = REQUESTER.get() or (None, channel.id)
+        waited = time.perf_counter()
+        slot = await self._admit(server, cmd, cmd_args, requester, lambda text: self.sender.send(channel, text))
+        if slot is None:
+            return None
+        try:
+            # time spent waiting is counted as 'queue', not 'parse'
+            started = (started or waited) + time.perf_counter() - waited
+            return await self._execute_command(channel, server, cmd, cmd_args, started)
+        finally:
+            self.admission.release(slot)
+
+    async def _execute_command(self,
+                               channel,
+                               server: str,
+                               cmd: str,
+                               cmd_args: list,
+                               started: float):
+        """
+        Fetch, render and send the result of a command
+        """
+        params = {}
+        try:
+            if cmd_args:
+                params = self.parse_command_args(cmd, *cmd_args)
+            self.metrics.observe('parse', server, cmd, time.perf_counter() - started)
+
+            if server == FANOUT_TARGET:
+                with self.metrics.timed('fetch', server, cmd):
+                    embeds = await self._fanout_command(cmd, cmd_args, params)
+                with self.metrics.timed('send', server, cmd):
+                    await self.sender.send(channel, embeds=embeds)
+                return None
+
+            cmdfunc = self.fetch_command
+
+            if self._is_paginated(cmd, cmd_args):
+                with self.metrics.timed('fetch', server, cmd):
+                    js, total, age, _ = await self._fetch_page(server, cmd, params, 0)
+                if total > PAGE_SIZE:
+                    total_pages = -(-total // PAGE_SIZE)
+                    with self.metrics.timed('render', server, cmd):
+                        embed, _ = await self._render(server, cmd, js, cmd_args)
+                        embed = with_page_number(with_data_age(embed, age), 0, total_pages)
+                        self.rendered.put((server, cmd, tuple(cmd_args), 0), (embed, total_pages, 0))
+                    view = page_view(server, cmd, cmd_args, 0, total_pages)
+                    with self.metrics.timed('send', server, cmd):
+                        if isinstance(embed, Embed):
+                            await self.sender.send(channel, embed=embed, view=view)
+                        else:
+                            await self.sender.send(channel, embed, view=view)
+                    return None
+            else:
+                with self.metrics.timed('fetch', server, cmd):
+                    js, age = (await cmdfunc(server, cmd, params))
+
+            with self.metrics.timed('render', server, cmd):
+                embed, refreshable = await self._render(server, cmd, js, cmd_args)
+                embed = with_data_age(embed, age)
+
+            view = None
+            if refreshable:
+                view = refresh_view(server, cmd, cmd_args)
+
+            if embed is not None:
+                with self.metrics.timed('send', server, cmd):
                     if isinstance(embed, Embed):
-                        await message.channel.send(embed=embed,
-                                                   view=view)
+                        await self.sender.send(channel,
+                                               embed=embed,
+                                               view=view)
 
                     elif isinstance(embed, List):
-                        for m in embed:
-                            await message.channel.send(embed=m)
+                        await self.sender.send(channel, embeds=embed)
                     else:
-                        await message.channel.send(
-                            embed,
-                            view=view)
+                        await self.sender.send(channel,
+                                               embed,
+                                               view=view)
 
-            except Exception as e:
-                await message.channel.send(f"There was an error. Please check the ft_bot logs.")
-                traceback.print_exc()
-                logger.error("You got frogged: ", e)
+        except Exception as e:
+            await self.sender.send(channel, f"There was an error. Please check the ft_bot logs.")
+            traceback.print_exc()
+            logger.error(f"You got frogged: {e}")
+
+    def _add_slash_commands(self):
+        for cmd, handler in self.commands.items():
+            if handler == self._command_disabled:
+                continue
+            if handler == self._dispatch_command:
+                self.tree.add_command(self._slash_command(cmd))
+            else:
+                self.tree.add_command(self._slash_local_command(cmd, handler))
+
+    def _slash_allowed(self, interaction: discord.Interaction) -> bool:
+        if interaction.channel_id in self.ignored_channels:
+            return False
+        return not self.allowed_channels or interaction.channel_id in self.allowed_channels
+
+    def _slash_command(self, cmd: str) -> app_commands.Command:
+        """
+        Make a slash command that runs cmd like its text version
+        """
+        @app_commands.describe(server=f"Server name, or '{FANOUT_TARGET}'",
+                               args="Optional arguments, e.g. a trade id or a number of days")
+        async def _callback(interaction: discord.Interaction,
+                            server: Optional[str] = None,
+                            args: Optional[str] = None):
+            if not self._slash_allowed(interaction):
+                await interaction.response.send_message("Commands are not enabled in this channel.",
+                                                        ephemeral=True)
+                return
+            # upstream calls can take longer than the 3s discord gives to answer an interaction
+            await interaction.response.defer(thinking=True)
+            started = time.perf_counter()
+            REQUESTER.set((interaction.user.id, interaction.channel_id))
+            channel = InteractionChannel(interaction)
+            server, _ = self._resolve_server([server] if server else [])
+            if server is None:
+                await self.sender.send(channel, (
+                    f"More than one server available, but no server specified. Use:\n"
+                    f"{self.available_calls[cmd].__doc__}"
+                ))
+                return
+            await self._run_command(channel, server, cmd, args.split() if args else [], started)
+
+        command = app_commands.Command(name=cmd,
+                                       description=slash_description(self.available_calls[cmd].__doc__),
+                                       callback=_callback)
+
+        @command.autocomplete('server')
+        async def _complete_server(interaction: discord.Interaction, current: str):
+            names = list(self.servers) + [FANOUT_TARGET]
+            return [app_commands.Choice(name=n, value=n) for n in names if n.startswith(current)][:25]
+
+        return command
+
+    def _slash_local_command(self, cmd: str, handler) -> app_commands.Command:
+        async def _callback(interaction: discord.Interaction, args: Optional[str] = None):
+            if not self._slash_allowed(interaction):
+                await interaction.response.send_message("Commands are not enabled in this channel.",
+                                                        ephemeral=True)
+                return
+            await interaction.response.defer(thinking=True)
+            REQUESTER.set((interaction.user.id, interaction.channel_id))
+            await handler(InteractionChannel(interaction), cmd, args.split() if args else [])
+
+        description = slash_description(handler.__doc__) if handler.__doc__ else f"Show the bot's {cmd}"
+        return app_commands.Command(name=cmd, description=description, callback=_callback)
 
     def parse_command_args(self, cmd, *command_args):
         params = {}
 
         if len(command_args) > 0:
-            if cmd in ['daily','weekly','monthly']:
+            if cmd in TIMEUNITS:
                 params['timescale'] = command_args[0]
             elif cmd in ['trades']:
                 params['limit'] = command_args[0]
@@ -668,6 +3539,460 @@ class ft_bot(discord.Client):
 
         return params
 
+def _period_numbers(times: np.ndarray, unit: str) -> np.ndarray:
+    """
+    Number the hours, days, weeks (from Monday), months or quarters since the epoch
+    """
+    if unit == 'hours':
+        return times.astype('datetime64[h]').astype(np.int64)
+    if unit == 'days':
+        return times.astype('datetime64[D]').astype(np.int64)
+    if unit == 'weeks':
+        # 1970-01-01 was a Thursday
+        return (times.astype('datetime64[D]').astype(np.int64) + 3) // 7
+    if unit == 'months':
+        return times.astype('datetime64[M]').astype(np.int64)
+    if unit == 'quarters':
+        return times.astype('datetime64[M]').astype(np.int64) // 3
+    raise Exception(f"Unknown time unit '{unit}'")
+
+def _period_start(number: np.ndarray, unit: str) -> np.ndarray:
+    if unit == 'hours':
+        return number.astype('datetime64[h]')
+    if unit == 'days':
+        return number.astype('datetime64[D]')
+    if unit == 'weeks':
+        return (number * 7 - 3).astype('datetime64[D]')
+    if unit == 'months':
+        return number.astype('datetime64[M]').astype('datetime64[D]')
+    return (number * 3).astype('datetime64[M]').astype('datetime64[D]')
+
+def current_period(unit: str, now: Optional[datetime] = None) -> int:
+    now = now or datetime.now(timezone.utc)
+    return int(_period_numbers(np.array([int(now.timestamp() * 1000)], dtype='datetime64[ms]'), unit)[0])
+
+def bucket_profits(close_timestamps: np.ndarray,
+                   profits: np.ndarray,
+                   unit: str,
+                   timescale: int,
+                   now: Optional[datetime] = None) -> tuple:
+    """
+    Sum trade profits into the last <timescale> periods of a time unit (UTC), most recent first
+    :param close_timestamps: Trade close times in milliseconds since the epoch
+    :param profits: Absolute profit of each trade
+    :param unit: One of hours, days, weeks, months or quarters
+    :param timescale: Number of periods to return
+    :param now: Time to count back from, defaults to now
+    :return: (period start strings, profit per period, trade count per period)
+    """
+    current = current_period(unit, now)
+    index = current - _period_numbers(close_timestamps.astype('datetime64[ms]'), unit)
+    mask = (index >= 0) & (index < timescale)
+
+    amounts = np.bincount(index[mask], weights=profits[mask], minlength=timescale).astype(np.float64)
+    counts = np.bincount(index[mask], minlength=timescale)
+
+    starts = _period_start(current - np.arange(timescale), unit)
+    if unit == 'hours':
+        labels = [s.replace("T", " ") + ":00" for s in np.datetime_as_string(starts)]
+    else:
+        labels = [str(s) for s in np.datetime_as_string(starts)]
+    return labels, amounts, counts
+
+def order_ladder(orders: List[dict],
+                 fee: float = 0.0,
+                 is_short: bool = False,
+                 current_rate: Optional[float] = None) -> dict:
+    """
+    Running totals over a trade's orders, computed in one pass
+    :param orders: The trade's orders, oldest first, as returned by freqtrade
+    :param fee: The trade's entry fee ratio
+    :param is_short: Whether the trade is short
+    :param current_rate: Rate to compute each fill's profit against
+    :return: Per fill arrays of amounts, prices, average price so far incl. fees, distance from the first entry,
+             distance from the average incl. fees and profit at current_rate, and the DCA totals
+    """
+    n = len(orders)
+    filled = np.fromiter((o['is_open'] is not True for o in orders), dtype=bool, count=n)
+    amounts = np.fromiter(((o['filled'] or o['amount']) if f else 0.0 for o, f in zip(orders, filled)),
+                          dtype=np.float64, count=n)
+    prices = np.fromiter(((o['safe_price'] or 0.0) if f else 0.0 for o, f in zip(orders, filled)),
+                         dtype=np.float64, count=n)
+    entries = filled & np.fromiter((bool(o.get('ft_is_entry', True)) for o in orders), dtype=bool, count=n)
+    exits = filled & ~entries & np.fromiter((o.get('ft_order_side') != 'stoploss' for o in orders),
+                                            dtype=bool, count=n)
+    fee_base = np.fromiter((o.get('ft_fee_base') or 0.0 for o in orders), dtype=np.float64, count=n)
+
+    # like freqtrade's telegram, the average for the k-th fill is taken over the first k orders,
+    # but priced including fees: the fee ratio on the cost and fees taken from the amount received
+    fee_factor = 1 - fee if is_short else 1 + fee
+    received = amounts - np.where(entries, fee_base, 0.0)
+    stakes = np.cumsum(amounts * prices) * fee_factor
+    held = np.cumsum(received)
+    nr = np.count_nonzero(filled)
+    averages = np.divide(stakes[:nr], held[:nr], out=np.zeros(nr), where=held[:nr] > 0)
+
+    fill_amounts = amounts[filled]
+    fill_prices = prices[filled]
+    fill_received = received[filled]
+    fee_prices = np.divide(fill_amounts * fill_prices * fee_factor, fill_received,
+                           out=fill_prices * fee_factor, where=fill_received > 0)
+    first = fill_prices[0] if nr else 0.0
+    from_first = (fill_prices - first) / first if first else np.zeros(nr)
+    from_average = np.divide(fee_prices - averages, averages, out=np.zeros(nr), where=averages != 0)
+    profits = None
+    if current_rate:
+        profits = np.divide(current_rate - fill_prices, fill_prices, out=np.zeros(nr), where=fill_prices != 0)
+        if is_short:
+            profits = -profits
+
+    entry_cost = float(np.dot(amounts[entries], prices[entries]))
+    entry_amount = float(np.sum(received[entries]))
+    fee_average = entry_cost * fee_factor / entry_amount if entry_amount > 0 else 0.0
+    return {
+        'amounts': fill_amounts,
+        'prices': fill_prices,
+        'averages': averages,
+        'from_first': from_first,
+        'from_average': from_average,
+        'profits': profits,
+        'num_entries': int(np.count_nonzero(entries)),
+        'num_exits': int(np.count_nonzero(exits)),
+        'entry_cost': entry_cost,
+        'fee_average': fee_average,
+    }
+
+def portfolio_exposure(trades: List[dict], servers: List[str]) -> dict:
+    """
+    Aggregate open trades from many bots into exposure per pair and per quote currency
+    :param trades: Open trades, as returned by /status
+    :param servers: The server each trade came from
+    :return: Arrays per quote currency, and per pair with the pairs' order by gross exposure
+    """
+    n = len(trades)
+    pairs = np.array([t['pair'] for t in trades])
+    quotes = np.array([t['quote_currency'] for t in trades])
+    notional = np.fromiter((t['amount'] * (t.get('current_rate') or t['open_rate']) for t in trades),
+                           dtype=np.float64, count=n)
+    exposure = np.where(np.fromiter((bool(t.get('is_short')) for t in trades), dtype=bool, count=n),
+                        -notional, notional)
+    pnl = np.fromiter((t['profit_abs'] or 0.0 for t in trades), dtype=np.float64, count=n)
+    server_names, server_idx = np.unique(np.array(servers), return_inverse=True)
+
+    pair_keys, pair_idx = np.unique(pairs, return_inverse=True)
+    num_pairs = len(pair_keys)
+    # a pair's quote currency, from the first trade in it
+    first = np.empty(num_pairs, dtype=np.int64)
+    first[pair_idx[::-1]] = np.arange(n)[::-1]
+    pair_quotes = quotes[first]
+    # distinct (pair, server) combinations, counted per pair
+    held_by = np.unique(pair_idx * len(server_names) + server_idx) // len(server_names)
+
+    quote_keys, quote_idx = np.unique(quotes, return_inverse=True)
+    quote_gross = np.bincount(quote_idx, weights=notional)
+    pair_gross = np.bincount(pair_idx, weights=notional, minlength=num_pairs)
+    share_of = quote_gross[np.searchsorted(quote_keys, pair_quotes)]
+
+    return {
+        'quotes': quote_keys,
+        'quote_trades': np.bincount(quote_idx),
+        'quote_net': np.bincount(quote_idx, weights=exposure),
+        'quote_gross': quote_gross,
+        'quote_pnl': np.bincount(quote_idx, weights=pnl),
+        'pairs': pair_keys,
+        'pair_quotes': pair_quotes,
+        'pair_bots': np.bincount(held_by, minlength=num_pairs),
+        'pair_trades': np.bincount(pair_idx, minlength=num_pairs),
+        'pair_net': np.bincount(pair_idx, weights=exposure, minlength=num_pairs),
+        'pair_pnl': np.bincount(pair_idx, weights=pnl, minlength=num_pairs),
+        'pair_share': np.divide(pair_gross, share_of, out=np.zeros(num_pairs), where=share_of > 0),
+        'order': np.argsort(-pair_gross, kind='stable'),
+    }
+
+def jwt_expiry(token: str) -> float:
+    """
+    Get the expiry timestamp of a JWT token from its 'exp' claim
+    :param token: Encoded JWT token
+    :return: Expiry as a unix timestamp, or a short default lifetime if unreadable
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except Exception:
+        return time.time() + DEFAULT_TOKEN_LIFETIME
+
+def format_event(server: str, msg_type: str, data) -> Embed:
+    """
+    Render a freqtrade message websocket event
+    :param server: Server the event came from
+    :param msg_type: Event type, e.g. entry_fill
+    :param data: Event payload
+    """
+    title = f"{server} - {msg_type.replace('_', ' ').capitalize()}"
+    if not isinstance(data, dict):
+        return discord.Embed(title=title, description=f"{data}")
+    if 'trade_id' not in data:
+        return discord.Embed(title=title, description=f"{data.get('status', data)}")
+
+    colour = Color.blue()
+    lines = [
+        f"*Trade ID:* `{data['trade_id']}`",
+        f"*Pair:* `{data.get('pair')}`",
+        f"*Direction:* `{data.get('direction', 'Long')}`",
+        f"*Amount:* `{data.get('amount')}`",
+    ]
+    if msg_type.startswith('entry'):
+        lines.append(f"*Open Rate:* `{data.get('open_rate')}`")
+        if data.get('enter_tag'):
+            lines.append(f"*Enter Tag:* `{data['enter_tag']}`")
+    else:
+        lines.append(f"*Close Rate:* `{data.get('close_rate')}`")
+        if data.get('exit_reason'):
+            lines.append(f"*Exit Reason:* `{data['exit_reason']}`")
+        if data.get('profit_ratio') is not None:
+            lines.append(f"*Profit:* `{data['profit_ratio']:.2%} "
+                         f"({round_coin_value(data.get('profit_amount') or 0, data.get('stake_currency', ''))})`")
+            colour = Color.green() if data['profit_ratio'] > 0 else Color.red()
+
+    return discord.Embed(title=title, description="\n".join(lines), color=colour)
+
+def format_alert(rule: AlertRule, server: str, item: dict, value: float, firing: bool) -> Embed:
+    """
+    Render an alert firing or being resolved
+    """
+    def fmt(v):
+        return f"{v:.2%}" if rule.field.endswith('_ratio') or rule.field == 'max_drawdown' else f"{v:g}"
+
+    level = rule.above if rule.above is not None else rule.below
+    where = f"trade {item['trade_id']} ({item.get('pair', '?')})" if rule.source == 'trades' else "profit"
+    if firing:
+        text = f"{rule.field} is {fmt(value)}, {'above' if rule.above is not None else 'below'} {fmt(level)}"
+    else:
+        text = f"{rule.field} is back at {fmt(value)}"
+    return discord.Embed(title=f"{server}: {rule.name} {'firing' if firing else 'resolved'}",
+                         description=f"*{where}:* `{text}`",
+                         color=Color.red() if firing else Color.green())
+
+def rendered_text(rendered) -> str:
+    """
+    Get the text content of a rendered command result (embed or string)
+    """
+    if isinstance(rendered, Embed):
+        if rendered.description:
+            return rendered.description
+        return "\n".join(f"*{f.name}:* `{f.value}`" for f in rendered.fields)
+    return str(rendered) if rendered is not None else ""
+
+def split_message(text: str, limit: int) -> List[str]:
+    """
+    Split text into chunks no longer than limit, breaking at line ends where
+    possible and closing and reopening code blocks that span two chunks
+    :param text: Text to split
+    :param limit: Maximum length of each chunk
+    """
+    if len(text) <= limit:
+        return [text]
+
+    width = limit - 8
+    lines = []
+    for line in text.splitlines(keepends=True):
+        lines.extend(line[i:i + width] for i in range(0, len(line), width))
+
+    chunks = []
+    current = ""
+    for line in lines:
+        if current and len(current) + len(line) + 3 > limit:
+            if current.count("```") % 2 == 1:
+                chunks.append(current + "```")
+                current = "```\n"
+            else:
+                chunks.append(current)
+                current = ""
+        current += line
+    if current:
+        chunks.append(current)
+    return chunks
+
+def split_embed(embed: Embed) -> List[Embed]:
+    """
+    Split an embed whose description is too long into several embeds
+    """
+    if not embed.description or len(embed.description) <= EMBED_DESCRIPTION_LIMIT:
+        return [embed]
+
+    parts = split_message(embed.description, EMBED_DESCRIPTION_LIMIT)
+    # Embed.copy() shares the field list, so keep these before clearing them off the first part
+    fields = list(embed.fields)
+    footer = embed.footer
+    timestamp = embed.timestamp
+    embeds = []
+    for i, part in enumerate(parts):
+        e = embed.copy() if i == 0 else discord.Embed(color=embed.color)
+        e.description = part
+        if i == 0:
+            e.remove_footer()
+            e.clear_fields()
+            e.timestamp = None
+        if i == len(parts) - 1:
+            # the fields and footer, e.g. the data age and page number, follow the whole description
+            for field in fields:
+                e.add_field(name=field.name, value=field.value, inline=field.inline)
+            if footer.text or footer.icon_url:
+                e.set_footer(text=footer.text, icon_url=footer.icon_url)
+            e.timestamp = timestamp
+        embeds.append(e)
+    return embeds
+
+def clamp_page(page: int, total: int) -> int:
+    """
+    Keep a page number within the pages of a table with total rows
+    """
+    return max(0, min(page, -(-total // PAGE_SIZE) - 1))
+
+def with_page_number(rendered, page: int, total_pages: int):
+    """
+    Label a rendered page with its page number
+    """
+    label = f"Page {page + 1}/{total_pages}"
+    if isinstance(rendered, Embed):
+        footer = rendered.footer.text
+        return rendered.set_footer(text=f"{footer} | {label}" if footer else label)
+    return f"{rendered}\n*{label}*"
+
+def with_data_age(rendered, age: Optional[float]):
+    """
+    Label a rendered command result with the age of the data it was made from
+    :param rendered: Embed or string returned by a command callback
+    :param age: Age of the data in seconds, or None for live data
+    """
+    if age is None or rendered is None:
+        return rendered
+    footer = f"Data age: {age:.0f}s"
+    if isinstance(age, StaleAge):
+        footer = f"Last known data from {arrow.utcnow().shift(seconds=-age).humanize()}, live data is not available yet"
+    if isinstance(rendered, Embed):
+        # keeps a page number that is already there
+        label = rendered.footer.text
+        return rendered.set_footer(text=f"{footer} | {label}" if label else footer)
+    if isinstance(rendered, list):
+        return rendered[:-1] + [with_data_age(rendered[-1], age)] if rendered else rendered
+    return f"{rendered}\n*{footer}*"
+
+def truncate_block(text: str, limit: int) -> str:
+    """
+    Truncate text to a character limit, closing any open code block
+    :param text: Text to truncate
+    :param limit: Maximum number of characters to return
+    :return: Text no longer than limit
+    """
+    if len(text) <= limit:
+        return text
+    suffix = "\n…"
+    body = text[:limit - len(suffix) - 3]
+    if body.count("```") % 2 == 1:
+        suffix += "```"
+    return body + suffix
+
+def command_priority(cmd: str, cmd_args: list) -> int:
+    """
+    Priority of a command for the admission scheduler, lower runs first
+    """
+    if cmd == 'status' and cmd_args:
+        # a single trade
+        return 0
+    return COMMAND_PRIORITIES.get(cmd, HEAVY_PRIORITY)
+
+def config_status(srv: dict) -> str:
+    """
+    Describe how current a server's config is, for /servers
+    """
+    retry = srv.get('config_retry_at', 0) - time.monotonic() if srv.get('config_failures') else 0
+    if 'config' not in srv:
+        return f"missing, retry in {retry:.0f}s" if retry > 0 else "missing"
+    if srv.get('config_at') is None:
+        status = "saved"
+    else:
+        status = f"v{srv.get('config_version', 1)}, {time.monotonic() - srv['config_at']:.0f}s old"
+    return f"{status}, retry in {retry:.0f}s" if retry > 0 else status
+
+def encode_args(cmd_args: list) -> str:
+    return quote(" ".join(cmd_args), safe='')
+
+def decode_args(encoded: str) -> List[str]:
+    return unquote(encoded).split()
+
+def fits_custom_ids(view: discord.ui.View) -> bool:
+    return all(len(item.custom_id) <= CUSTOM_ID_LIMIT for item in view.children)
+
+def content_hash(rendered) -> str:
+    """
+    Hash what a rendered command result would show, to tell if it has changed
+    """
+    if isinstance(rendered, Embed):
+        rendered = [rendered]
+    if isinstance(rendered, list):
+        payload = json.dumps([e.to_dict() if isinstance(e, Embed) else str(e) for e in rendered],
+                             sort_keys=True, default=str)
+    else:
+        payload = str(rendered)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+def fit_embed(embed: Embed) -> Embed:
+    """
+    Cut an embed's description down to the embed limit, for edits, which can't be split
+    """
+    if not embed.description or len(embed.description) <= EMBED_DESCRIPTION_LIMIT:
+        return embed
+    embed = embed.copy()
+    embed.description = truncate_block(embed.description, EMBED_DESCRIPTION_LIMIT)
+    return embed
+
+def rendered_message(rendered) -> dict:
+    """
+    Fit a rendered command result into the content and embeds of one message
+    """
+    if isinstance(rendered, Embed):
+        return {'content': None, 'embeds': [fit_embed(rendered)]}
+    if isinstance(rendered, list):
+        text = "\n".join(str(r) for r in rendered if not isinstance(r, Embed))
+        return {'content': truncate_block(text, MESSAGE_LIMIT) if text else None,
+                'embeds': [fit_embed(r) for r in rendered if isinstance(r, Embed)][:EMBEDS_PER_MESSAGE]}
+    return {'content': truncate_block(str(rendered), MESSAGE_LIMIT), 'embeds': []}
+
+def slash_description(doc: Optional[str]) -> str:
+    """
+    Get a slash command description from the first line of a command docstring
+    """
+    line = (doc or "").strip().split("\n")[0]
+    description = line.split(" : ", 1)[-1].strip()
+    return truncate_block(description, 100) if description else "-"
+
+def histogram_quantile(buckets: tuple, counts: List[int], q: float) -> Optional[float]:
+    """
+    Estimate a quantile from histogram bucket counts, interpolating within a bucket
+    :param buckets: Upper bounds of the buckets
+    :param counts: Count per bucket, plus one for values above the last bound
+    :param q: Quantile between 0 and 1
+    """
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for upper, n in zip(buckets, counts):
+        if n and cumulative + n >= rank:
+            return lower + (upper - lower) * (rank - cumulative) / n
+        cumulative += n
+        lower = upper
+    return buckets[-1]
+
+def prometheus_labels(**labels) -> str:
+    escaped = {k: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for k, v in labels.items()}
+    return ",".join(f'{k}="{v}"' for k, v in escaped.items())
+
 class dotdict(dict):
     """dot.notation access to dictionary attributes"""
     __getattr__ = dict.get
@@ -715,8 +4040,10 @@ def add_arguments():
     return args
 
 def main(args):
+    config_path = None
     if args.yaml is not None:
         import yaml
+        config_path = args.yaml
         with open(args.yaml, 'r') as yamlfile:
             args = dotdict(yaml.safe_load(yamlfile))
             args.yaml = True
@@ -732,13 +4059,23 @@ def main(args):
         intents.message_content = True
 
         try:
-            if args.disabled_calls and len(args.disabled_calls) > 0:
-                client = ft_bot(intents=intents,
-                                servers=args.servers,
-                                disabled_calls=args.disabled_calls)
-            else:
-                client = ft_bot(intents=intents,
-                                servers=args.servers)
+            client = ft_bot(intents=intents,
+                            servers=args.servers,
+                            disabled_calls=args.disabled_calls or None,
+                            cache=args.cache,
+                            poller=args.poller,
+                            trade_store=args.trade_store,
+                            warm_cache=args.warm_cache,
+                            events=args.events,
+                            metrics=args.metrics,
+                            channels=args.channels,
+                            ignored_channels=args.ignored_channels,
+                            slash_commands=args.slash_commands,
+                            config_path=config_path,
+                            log_channel=args.log_channel,
+                            workers=args.workers,
+                            admission=args.admission,
+                            alerts=args.alerts)
 
             client.run(args.token)
         except Exception as e: